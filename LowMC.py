@@ -1,10 +1,65 @@
 # Python port of LowMC.cpp found at
 # https://github.com/LowMC/lowmc/blob/master/LowMC.cpp
 
+import LowMC_instance
+import gf2
+
 def xor_block(block1, block2):
     return [b1 ^ b2 for b1, b2 in zip(block1, block2)]
 
-state = None  # Keeps the 80 bit LSFR state
+#
+# LowMC public data
+#
+
+numofboxes = 1  # Number of S-boxes
+blocksize = 128  # Block size in bits
+keysize = 40  # Key size in bits
+rounds = 1  # Number of rounds
+
+def linear_layer_counts():  # -> (unsigned, unsigned)
+    """XORs in the linear layers, when synthesized naively and as shared networks."""
+    networks = LowMC_instance.load(blocksize, keysize, numofboxes, rounds).linear_networks()
+    return (sum(net.naive_count for net in networks), sum(net.xor_count for net in networks))
+
+def substitution(message, zero, numofboxes=numofboxes):  # -> block
+    """
+    S-box layer from the algebraic normal form of the LowMC S-box, which
+    needs three ANDs per S-box.  Bits of S-boxes that lie past the end of the
+    block are taken to be `zero` and their outputs dropped, as in `LowMC_test`.
+    """
+    temp = list(message)
+    for i in range(min(numofboxes, -(-len(message) // 3))):
+        (a, b, c) = (message[3*i:3*i+3] + [zero, zero])[0:3]
+        sb = [a ^ b ^ c ^ (b & c), b ^ c ^ (a & c), c ^ (a & b)]
+        temp[3*i:3*i+3] = sb[0:len(temp[3*i:3*i+3])]
+    return temp
+
+def init_encrypt_packed():
+    """
+    Native `encrypt` on blocks and keys packed into ints (bit i is element i),
+    with the linear layers applied by table lookups.
+    """
+    instance = LowMC_instance.load(blocksize, keysize, numofboxes, rounds)
+    tables = [gf2.matvec_tables(mat, blocksize) for mat in instance.LinMatrices]
+    boxes = range(min(numofboxes, -(-blocksize // 3)))
+    boxmask = sum(1 << (3*i) for i in boxes)
+    sboxmask = (boxmask | (boxmask << 1) | (boxmask << 2)) & ((1 << blocksize) - 1)
+
+    def substitution_packed(message):  # -> int
+        (a, b, c) = (message & boxmask, (message >> 1) & boxmask, (message >> 2) & boxmask)
+        sb = (a ^ b ^ c ^ (b & c)) | ((b ^ c ^ (a & c)) << 1) | ((c ^ (a & b)) << 2)
+        return (message & ~sboxmask) | (sb & sboxmask)
+
+    def encrypt(message, key=None):  # -> int
+        keys = instance.roundkeys if key is None else [gf2.matvec(mat, key) for mat in instance.KeyMatrices]
+        c = message ^ keys[0]
+        for r in range(rounds):
+            c = substitution_packed(c)
+            c = gf2.combine(tables[r], c)
+            c = c ^ instance.roundconstants[r] ^ keys[r+1]
+        return c
+
+    return encrypt
 
 def init_encrypt(_constant, _constants):
     #
@@ -13,62 +68,35 @@ def init_encrypt(_constant, _constants):
 
     bitset = lambda n, b : list([b])*n
 
-
-    #
-    # LowMC public data
-    #
-
-    numofboxes = 1  # Number of S-boxes
-    blocksize = 128  # Block size in bits
-    keysize = 40  # Key size in bits
-    rounds = 1  # Number of rounds
-
     block = lambda : bitset(blocksize, 0)  # Stores messages
-    keyblock = lambda : bitset(keysize, 0)  # Stores states
 
 
     #
     # LowMC private data members
     #
 
-    # 3-bit binary bit arrays (in little-endian)
-    bin0 = _constants([0,0,0])
-    bin1 = _constants([1,0,0])
-    bin2 = _constants([0,1,0])
-    bin3 = _constants([1,1,0])
-    bin4 = _constants([0,0,1])
-    bin5 = _constants([1,0,1])
-    bin6 = _constants([0,1,1])
-    bin7 = _constants([1,1,1])
-
-    # The S-box and its inverse
-    Sbox = [bin0, bin1, bin3, bin6, bin7, bin4, bin5, bin2]  # vector<unsigned>
+    # Matrices, round constants and round keys (for the default key), generated once and then cached
+    instance = LowMC_instance.load(blocksize, keysize, numofboxes, rounds)
+    unpack = lambda row : [(row >> i) & 1 for i in range(blocksize)]
 
-    LinMatrices = [[block() for _ in range(blocksize)] for _ in range(rounds)]  # Stores the binary matrices for each round
-    roundconstants = [block() for _ in range(rounds)]  # Stores the round constants
-    key = None  # Stores the master key
-    KeyMatrices = [[keyblock() for _ in range(blocksize)] for _ in range(rounds+1)]  # Stores the matrices that generate the round keys
-    roundkeys = [keyblock() for _ in range(rounds+1)]  # Stores the round keys
-
-    default_key = list(reversed([
-        1, 0, 0, 1, 0, 0, 1, 0, 0, 1,
-        0, 1, 1, 0, 1, 1, 0, 1, 1, 0,
-        0, 1, 1, 0, 1, 1, 0, 1, 1, 0,
-        1, 0, 0, 1, 0, 0, 1, 0, 0, 1
-    ]))
-    key = default_key
+    LinNetworks = instance.linear_networks()  # Stores the XOR networks of the binary matrices for each round
+    roundconstants = [unpack(row) for row in instance.roundconstants]  # Stores the round constants
+    roundkeys = [unpack(row) for row in instance.roundkeys]  # Stores the round keys
+    KeyNetwork = instance.key_network()  # Stores the XOR network that generates the round keys from a given key
 
     #
     # LowMC functions
     #
 
-    def encrypt(message: block):#, k=None: keyblock):  # -> block
-        c = xor_block(message, _constants(roundkeys[0]))
+    def encrypt(message: block, key=None):  # -> block
+        # The key is either the default one or a keysize list of bits (or wires)
+        keys = [_constants(k) for k in roundkeys] if key is None else keyschedule(key)
+        c = xor_block(message, keys[0])
         for r in range(rounds):
             c = Substitution(c)
-            c = MultiplyWithGF2Matrix(LinMatrices[r], c)
+            c = MultiplyWithGF2Matrix(LinNetworks[r], c)
             c = xor_block(c, _constants(roundconstants[r]))
-            c = xor_block(c, _constants(roundkeys[r+1]))
+            c = xor_block(c, keys[r+1])
 
         return c
 
@@ -78,254 +106,30 @@ def init_encrypt(_constant, _constants):
     #
 
     def Substitution(message: block):  # -> block
+        return substitution(message, _constant(0), numofboxes)
 
-        # Get the identity part of the message
-        j = 3*numofboxes
-        temp = message[j:] + _constants([0 for _ in range(j)])
-
-        # Get the rest through the S-boxes
-        for i in range(numofboxes):
-            temp = _constants([0, 0, 0]) + temp[:-3]
-            j = 3*(numofboxes-i-1)
-            idx_bits = (message[j:] + _constants([0 for _ in range(j)]))
-
-            a, b, c = idx_bits[0:3]
-            inv = lambda t : ~t
-            eqt = lambda x,y,z : (inv(a^x)) & (inv(b^y)) & (inv(c^z))
-            ife = lambda x,y,z,cmp : [x&cmp, y&cmp, z&cmp]
-            add = lambda x,y,z,u,v,w : [x^u, y^v, z^w]
-
-            sb = add(
-                *add(
-                    *add(
-                        *ife(*Sbox[0], eqt(*bin0)),
-                        *ife(*Sbox[1], eqt(*bin1))
-                    ),
-                    *add(
-                        *ife(*Sbox[2], eqt(*bin2)),
-                        *ife(*Sbox[3], eqt(*bin3))
-                    )
-                ),
-                *add(
-                    *add(
-                        *ife(*Sbox[4], eqt(*bin4)),
-                        *ife(*Sbox[5], eqt(*bin5))
-                    ),
-                    *add(
-                        *ife(*Sbox[6], eqt(*bin6)),
-                        *ife(*Sbox[7], eqt(*bin7))
-                    )
-                )
-            )
-
-            sblock = _constants(block())
-            sblock[0:3] = sb[0:3]
-            temp = xor_block(temp, sblock)
-
-        return temp
 
+    def MultiplyWithGF2Matrix(network, message):  # -> block
+        # Shared XORs only; the matrix is constant, so no ANDs are needed
+        return network.evaluate(message, _constant(0))
 
-    def MultiplyWithGF2Matrix(matrix, message):  # -> block
-        temp = block()
-        for i in range(blocksize):
-            temp[i] = _constant(0)
-            for mb, b in zip(message, _constants(matrix[i])):
-                temp[i] = temp[i] ^ (mb & b)
-        return temp
 
+    def keyschedule(key):  # -> vector<block>
+        keys = MultiplyWithGF2Matrix(KeyNetwork, key)
+        return [keys[r*blocksize:(r+1)*blocksize] for r in range(rounds+1)]
 
-    def MultiplyWithGF2Matrix_Key(matrix, k, isc=True):  # -> block
-        temp = block()
-        for i in range(blocksize):
-            temp[i] = _constant(0) if isc else _constant(0)
-            for kb, b in zip(k, _constants(matrix[i]) if isc else matrix[i]):
-                temp[i] = temp[i] ^ (kb & b)
-        return temp
-
-
-    def keyschedule():  # -> void
-        roundkeys.clear()
-        for r in range(rounds+1):
-            roundkeys.append(
-                MultiplyWithGF2Matrix_Key(KeyMatrices[r], key, False)
-            )
-
-        return
-
-
-    def instantiate_LowMC():  # -> void
-        # Create LinMatrices
-        LinMatrices.clear()
-        for r in range(rounds):
-            # Create matrix
-            mat = [block() for _ in range(blocksize)]
-
-            # Fill matrix with random bits
-            while True:
-                mat.clear()
-                for i in range(blocksize):
-                    mat.append(
-                        getrandblock()
-                    )
-
-                # Done if matrix is invertible
-                if rank_of_Matrix(mat) == blocksize:
-                    break
-
-            LinMatrices.append(mat)
-
-        # Create roundconstants
-        roundconstants.clear()
-        for r in range(rounds):
-            roundconstants.append(
-                getrandblock()
-            )
-
-        # Create KeyMatrices
-        KeyMatrices.clear()
-        for r in range(rounds+1):
-            # Create matrix
-            mat = [keyblock() for _ in range(keysize)]
-
-            # Fill matrix with random bits
-            while True:
-                mat.clear()
-                for i in range(blocksize):
-                    mat.append(
-                        getrandkeyblock()
-                    )
-
-                # Repeat unless matrix is of maximal rank
-                if rank_of_Matrix_Key(mat) >= min(blocksize, keysize):
-                    break
-
-            KeyMatrices.append(mat)
-
-
-    #
-    # Binary matrix functions
-    #
-
-    def rank_of_Matrix(matrix):   # -> unsigned
-        # Copy of the matrix
-        mat = [block() for _ in range(blocksize)]
-        for i in range(blocksize):
-            for j in range(blocksize):
-                mat[i][j] = matrix[i][j]
-
-        size = len(mat[0])
-
-        # Transform to upper triangular matrix
-        row = 0
-        for col in reversed(range(size)):
-            if not mat[row][col]:
-                r = row
-                while r < len(mat) and not mat[r][col]:
-                    r = r + 1
-
-                if r >= len(mat):
-                    continue
-                else:
-                    temp = mat[row]
-                    mat[row] = mat[r]
-                    mat[r] = temp
-
-            for i in range(row+1, len(mat)):
-                if mat[i][col]:
-                    mat[i] = xor_block(mat[i], mat[row])
-
-            row = row + 1
-            if row == size:
-                break
-
-        return row
-
-
-    def rank_of_Matrix_Key(matrix):  # -> unsigned
-        # Copy of the matrix
-        # BUG from actual LowMC cpp code (?)  Should the below instead be `keysize`?
-        mat = [keyblock() for _ in range(blocksize)]
-        for i in range(blocksize):
-            for j in range(keysize):
-                mat[i][j] = matrix[i][j]
-
-        size = len(mat[0])
-
-        # Transform to upper triangular matrix
-        row = 0
-        for col in range(1, size+1):
-            if not mat[row][size-col]:
-                r = row
-                while r < len(mat) and (0 == mat[r][size-col]):
-                    r = r + 1
-
-                if r >= len(mat):
-                    continue
-                else:
-                    temp = mat[row]
-                    mat[row] = mat[r]
-                    mat[r] = temp
-
-            for i in range(row+1, len(mat)):
-                if mat[i][size-col]:
-                    mat[i] = xor_block(mat[i], mat[row])
-
-            row = row + 1
-            if row == size:
-                break
-
-        return row
-
-
-    #
-    # Pseudorandom bits
-    #
-
-    def getrandblock():  # -> block
-        return [getrandbit() for i in range(blocksize)]
-
-
-    def getrandkeyblock():  # -> keyblock
-        return [getrandbit() for i in range(keysize)]
-
-
-    # Uses the Grain LSFR as self-shrinking generator to create pseudorandom bits
-    # Is initialized with the all 1s state
-    # The first 160 bits are thrown away
-    def getrandbit():  # -> bool
-        global state
-        tmp = 0
-
-        # If state has not been initialized yet
-        if state is None:
-            state = bitset(80, 1)  # Initialize with all bits set
-
-            # Throw the first 160 bits away
-            for _ in range(160):
-                # Update the state
-                tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-                state = state[1:] + [0]
-                state[79] = tmp
-
-        # Choice records whether the first bit is 1 or 0.
-        # The second bit is produced if the first bit is 1.
-        while True:
-            # Update the state
-            tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-            state = state[1:] + [0]
-            state[79] = tmp
-            choice = tmp
-            tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-            state = state[1:] + [0]
-            state[79] = tmp
-
-            if choice:
-                break
-
-        return tmp
 
+    return encrypt
 
-    instantiate_LowMC()
-    keyschedule()
 
-    return encrypt
+if __name__ == "__main__":
+    # Check the S-box layer against the reference implementation.
+    import random
+    import LowMC_test
+    for boxes in (1, 2, 42, LowMC_test.numofboxes):
+        (LowMC_test.numofboxes, reference) = (boxes, LowMC_test.numofboxes)
+        for _ in range(100):
+            message = [random.getrandbits(1) for _ in range(blocksize)]
+            assert substitution(message, 0, boxes) == LowMC_test.Substitution(message), boxes
+        LowMC_test.numofboxes = reference
+    print("S-box layer matches LowMC_test.Substitution")
@@ -0,0 +1,143 @@
+# LowMC instances (matrices, constants and round keys for one parameter set),
+# generated once and cached in a compact binary file beside this module
+
+import os
+import struct
+import gf2
+from grain import grain
+
+tables_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LowMC_tables')
+
+default_key = list(reversed([
+    1, 0, 0, 1, 0, 0, 1, 0, 0, 1,
+    0, 1, 1, 0, 1, 1, 0, 1, 1, 0,
+    0, 1, 1, 0, 1, 1, 0, 1, 1, 0,
+    1, 0, 0, 1, 0, 0, 1, 0, 0, 1
+]))
+
+instances = {}  # Instances already loaded by this process
+
+
+def load(blocksize, keysize, numofboxes, rounds, key=None, seed=None):  # -> instance
+    """Instance for the given parameter set, generated at most once per machine."""
+    key = default_key if key is None else key
+    index = (blocksize, keysize, numofboxes, rounds, tuple(key), seed)
+    if index not in instances:
+        instances[index] = instance(blocksize, keysize, numofboxes, rounds, key, seed)
+    return instances[index]
+
+
+class instance:
+    """
+    Parameter set of LowMC with everything its encryption needs, with each
+    block and matrix row packed into one int (bit i is element i).
+    """
+    def __init__(self, blocksize, keysize, numofboxes, rounds, key, seed=None):
+        self.blocksize = blocksize
+        self.keysize = keysize
+        self.numofboxes = numofboxes
+        self.rounds = rounds
+
+        name = "_".join(map(str, [blocksize, keysize, numofboxes, rounds] + ([] if seed is None else [seed])))
+        path = os.path.join(tables_path, "LowMC_" + name + ".bin")
+        if os.path.exists(path):
+            self.read(path)
+        else:
+            self.instantiate_LowMC(grain(seed))
+            try:
+                os.makedirs(tables_path, exist_ok=True)
+                self.write(path + ".tmp")
+                os.replace(path + ".tmp", path)
+            except OSError:
+                pass  # Read-only install: keep the tables in memory only
+
+        self.set_key(key)
+
+    def set_key(self, key):  # -> void
+        self.key = sum(b << i for (i, b) in enumerate(key))
+        self.roundkeys = [gf2.matvec(mat, self.key) for mat in self.KeyMatrices]
+
+    def linear_networks(self):  # -> vector<gf2.xor_network>
+        """Shared XOR networks for the linear layer of each round, built on first use."""
+        if not hasattr(self, 'networks'):
+            self.networks = [gf2.xor_network(mat, self.blocksize) for mat in self.LinMatrices]
+        return self.networks
+
+    def key_network(self):  # -> gf2.xor_network
+        """Shared XOR network deriving all round keys (concatenated) from the key, built on first use."""
+        if not hasattr(self, 'keynetwork'):
+            self.keynetwork = gf2.xor_network([row for mat in self.KeyMatrices for row in mat], self.keysize)
+        return self.keynetwork
+
+    def instantiate_LowMC(self, lfsr):  # -> void
+        # Create LinMatrices and invLinMatrices
+        self.LinMatrices = []
+        self.invLinMatrices = []
+        for r in range(self.rounds):
+            # Fill matrix with random bits until it is invertible
+            while True:
+                mat = [lfsr.getrandbits(self.blocksize) for _ in range(self.blocksize)]
+                if gf2.rank(mat) == self.blocksize:
+                    break
+
+            self.LinMatrices.append(mat)
+            self.invLinMatrices.append(gf2.invert(mat, self.blocksize))
+
+        # Create roundconstants
+        self.roundconstants = [lfsr.getrandbits(self.blocksize) for _ in range(self.rounds)]
+
+        # Create KeyMatrices
+        self.KeyMatrices = []
+        for r in range(self.rounds+1):
+            # Repeat unless matrix is of maximal rank
+            while True:
+                mat = [lfsr.getrandbits(self.keysize) for _ in range(self.blocksize)]
+                if gf2.rank(mat) >= min(self.blocksize, self.keysize):
+                    break
+
+            self.KeyMatrices.append(mat)
+
+    #
+    # Binary table file: little-endian rows of fixed width, in the order below
+    #
+
+    header = struct.Struct("<4sIIII")
+
+    def tables(self):
+        rows = lambda mats: [row for mat in mats for row in mat]
+        return [
+            (rows(self.LinMatrices), self.blocksize),
+            (rows(self.invLinMatrices), self.blocksize),
+            (self.roundconstants, self.blocksize),
+            (rows(self.KeyMatrices), self.keysize)
+        ]
+
+    def write(self, path):  # -> void
+        with open(path, 'wb') as f:
+            f.write(instance.header.pack(b'LMC1', self.blocksize, self.keysize, self.numofboxes, self.rounds))
+            for (rows, width) in self.tables():
+                for row in rows:
+                    f.write(row.to_bytes((width + 7) // 8, 'little'))
+
+    def read(self, path):  # -> void
+        with open(path, 'rb') as f:
+            data = f.read()
+        params = instance.header.unpack_from(data)
+        if params != (b'LMC1', self.blocksize, self.keysize, self.numofboxes, self.rounds):
+            raise ValueError("LowMC table file '" + path + "' does not match its parameters")
+
+        offset = instance.header.size
+        def read_rows(count, width):
+            nonlocal offset
+            size = (width + 7) // 8
+            rows = [int.from_bytes(data[offset + i*size:offset + (i+1)*size], 'little') for i in range(count)]
+            offset += count * size
+            return rows
+
+        split = lambda rows, n: [rows[i:i+n] for i in range(0, len(rows), n)]
+        (b, k, r) = (self.blocksize, self.keysize, self.rounds)
+        self.LinMatrices = split(read_rows(r*b, b), b)
+        self.invLinMatrices = split(read_rows(r*b, b), b)
+        self.roundconstants = read_rows(r, b)
+        self.KeyMatrices = split(read_rows((r+1)*b, k), b)
+
@@ -1,6 +1,9 @@
 # Python port of LowMC.cpp found at
 # https://github.com/LowMC/lowmc/blob/master/LowMC.cpp
 
+import LowMC_instance
+import gf2
+
 #
 # Python polyfills for C++ std::bitset
 #
@@ -40,7 +43,14 @@ roundconstants = [block() for _ in range(rounds)]  # Stores the round constants
 key = 0  # Stores the master key
 KeyMatrices = [[keyblock() for _ in range(blocksize)] for _ in range(rounds+1)]  # Stores the matrices that generate the round keys
 roundkeys = [keyblock() for _ in range(rounds+1)]  # Stores the round keys
-state = None  # Keeps the 80 bit LSFR state
+
+# Packed copies of the above, with each block and matrix row held in one int (bit i is element i)
+packedLinMatrices = []
+packedInvLinMatrices = []
+packedRoundconstants = []
+packedRoundkeys = []
+packedLinTables = []  # Four Russians tables of the matrices above, for one lookup per byte in gf2.combine
+packedInvLinTables = []
 
 default_key = list(reversed([
     1, 0, 0, 1, 0, 0, 1, 0, 0, 1,
@@ -59,32 +69,70 @@ def encrypt(message: block):#, k=None: keyblock):  # -> block
     #     global key
     #     key = k
     #     keyschedule()
-    c = xor_block(message, roundkeys[0])
+    return unpack(encrypt_packed(pack(message)))
+
+
+def decrypt(ciphertext: block):  # -> block
+    return unpack(decrypt_packed(pack(ciphertext)))
+
+
+def set_key(k: keyblock):  # -> void
+    global key
+    key = k
+    keyschedule()
+
+
+#
+# Packed LowMC functions
+#
+
+def pack(b: block):  # -> int
+    return sum(bit << i for (i, bit) in enumerate(b))
+
+
+def unpack(x, n=blocksize):  # -> block
+    return [(x >> i) & 1 for i in range(n)]
+
+
+def encrypt_packed(message):  # -> int
+    c = message ^ packedRoundkeys[0]
     for r in range(rounds):
-        c = Substitution(c)
-        c = MultiplyWithGF2Matrix(LinMatrices[r], c)
-        c = xor_block(c, roundconstants[r])
-        c = xor_block(c, roundkeys[r+1])
+        c = SubstitutionPacked(c)
+        c = gf2.combine(packedLinTables[r], c)
+        c = c ^ packedRoundconstants[r] ^ packedRoundkeys[r+1]
 
     return c
 
 
-def decrypt(ciphertext: block):  # -> block
+def decrypt_packed(ciphertext):  # -> int
     m = ciphertext
     for r in reversed(range(rounds)):
-        m = xor_block(m, roundkeys[r+1])
-        m = xor_block(m, roundconstants[r])
-        m = MultiplyWithGF2Matrix(invLinMatrices[r], m)
-        m = invSubstitution(m)
-    m = xor_block(m, roundkeys[0])
+        m = m ^ packedRoundkeys[r+1] ^ packedRoundconstants[r]
+        m = gf2.combine(packedInvLinTables[r], m)
+        m = invSubstitutionPacked(m)
+    m = m ^ packedRoundkeys[0]
 
     return m
 
 
-def set_key(k: keyblock):  # -> void
-    global key
-    key = k
-    keyschedule()
+def encrypt_many(messages):  # -> vector<block>
+    # Round by round, with each linear layer applied to all states at once
+    cs = [(m if isinstance(m, int) else pack(m)) ^ packedRoundkeys[0] for m in messages]
+    for r in range(rounds):
+        cs = gf2.matvec_many(packedLinMatrices[r], blocksize, [SubstitutionPacked(c) for c in cs])
+        cs = [c ^ packedRoundconstants[r] ^ packedRoundkeys[r+1] for c in cs]
+
+    return [c if isinstance(m, int) else unpack(c) for (m, c) in zip(messages, cs)]
+
+
+def decrypt_many(ciphertexts):  # -> vector<block>
+    ms = [c if isinstance(c, int) else pack(c) for c in ciphertexts]
+    for r in reversed(range(rounds)):
+        ms = gf2.matvec_many(packedInvLinMatrices[r], blocksize, [m ^ packedRoundkeys[r+1] ^ packedRoundconstants[r] for m in ms])
+        ms = [invSubstitutionPacked(m) for m in ms]
+    ms = [m ^ packedRoundkeys[0] for m in ms]
+
+    return [m if isinstance(c, int) else unpack(m) for (c, m) in zip(ciphertexts, ms)]
 
 
 #
@@ -198,6 +246,34 @@ def MultiplyWithGF2Matrix(matrix, message):  # -> block
     return temp
 
 
+# Masks selecting the first, and all three, bits of every S-box (bits past the block are dropped)
+boxmask = sum(1 << (3*i) for i in range(numofboxes))
+sboxmask = boxmask | (boxmask << 1) | (boxmask << 2)
+blockmask = (1 << blocksize) - 1
+
+
+def SubstitutionPacked(message):  # -> int
+    # All S-boxes at once, from the algebraic normal form of Sbox
+    a = message & boxmask
+    b = (message >> 1) & boxmask
+    c = (message >> 2) & boxmask
+    sb = (a ^ b ^ c ^ (b & c)) | ((b ^ c ^ (a & c)) << 1) | ((c ^ (a & b)) << 2)
+    return ((message & ~sboxmask) | sb) & blockmask
+
+
+def invSubstitutionPacked(message):  # -> int
+    # All inverse S-boxes at once, from the algebraic normal form of invSbox
+    a = message & boxmask
+    b = (message >> 1) & boxmask
+    c = (message >> 2) & boxmask
+    sb = (a ^ b ^ c ^ (b & c)) | ((b ^ (a & c)) << 1) | ((b ^ c ^ (a & b)) << 2)
+    return ((message & ~sboxmask) | sb) & blockmask
+
+
+def MultiplyWithGF2MatrixPacked(rows, message):  # -> int
+    return gf2.matvec(rows, message)
+
+
 def MultiplyWithGF2Matrix_Key(matrix, k):  # -> block
     temp = block()
     for i in range(blocksize):
@@ -214,231 +290,26 @@ def keyschedule():  # -> void
             MultiplyWithGF2Matrix_Key(KeyMatrices[r], key)
         )
 
-    return
-
-
-def instantiate_LowMC():  # -> void
-    # Create LinMatrices and invLinMatrices
-    LinMatrices.clear()
-    invLinMatrices.clear()
-    for r in range(rounds):
-        # Create matrix
-        mat = [block() for _ in range(blocksize)]
-
-        # Fill matrix with random bits
-        while True:
-            mat.clear()
-            for i in range(blocksize):
-                mat.append(
-                    getrandblock()
-                )
-
-            # Done if matrix is invertible
-            if rank_of_Matrix(mat) == blocksize:
-                break
-
-        LinMatrices.append(mat)
-        invLinMatrices.append(invert_Matrix(LinMatrices[-1]))
-
-    # Create roundconstants
-    roundconstants.clear()
-    for r in range(rounds):
-        roundconstants.append(
-            getrandblock()
-        )
-
-    # Create KeyMatrices
-    KeyMatrices.clear()
-    for r in range(rounds+1):
-        # Create matrix
-        mat = [keyblock() for _ in range(keysize)]
-
-        # Fill matrix with random bits
-        while True:
-            mat.clear()
-            for i in range(blocksize):
-                mat.append(
-                    getrandkeyblock()
-                )
-
-            # Repeat unless matrix is of maximal rank
-            if rank_of_Matrix_Key(mat) >= min(blocksize, keysize):
-                break
-
-        KeyMatrices.append(mat)
-
-
-#
-# Binary matrix functions
-#
-
-def rank_of_Matrix(matrix):   # -> unsigned
-    # Copy of the matrix
-    mat = [block() for _ in range(blocksize)]
-    for i in range(blocksize):
-        for j in range(blocksize):
-            mat[i][j] = matrix[i][j]
-
-    size = len(mat[0])
-
-    # Transform to upper triangular matrix
-    row = 0
-    for col in reversed(range(size)):
-        if not mat[row][col]:
-            r = row
-            while r < len(mat) and not mat[r][col]:
-                r = r + 1
-
-            if r >= len(mat):
-                continue
-            else:
-                temp = mat[row]
-                mat[row] = mat[r]
-                mat[r] = temp
-
-        for i in range(row+1, len(mat)):
-            if mat[i][col]:
-                mat[i] = xor_block(mat[i], mat[row])
-
-        row = row + 1
-        if row == size:
-            break
-
-    return row
-
-
-def rank_of_Matrix_Key(matrix):  # -> unsigned
-    # Copy of the matrix
-    # BUG from actual LowMC cpp code (?)  Should the below instead be `keysize`?
-    mat = [keyblock() for _ in range(blocksize)]
-    for i in range(blocksize):
-        for j in range(keysize):
-            mat[i][j] = matrix[i][j]
-
-    size = len(mat[0])
-
-    # Transform to upper triangular matrix
-    row = 0
-    for col in range(1, size+1):
-        if not mat[row][size-col]:
-            r = row
-            while r < len(mat) and (0 == mat[r][size-col]):
-                r = r + 1
-
-            if r >= len(mat):
-                continue
-            else:
-                temp = mat[row]
-                mat[row] = mat[r]
-                mat[r] = temp
-
-        for i in range(row+1, len(mat)):
-            if mat[i][size-col]:
-                mat[i] = xor_block(mat[i], mat[row])
-
-        row = row + 1
-        if row == size:
-            break
+    packedRoundkeys.clear()
+    packedRoundkeys.extend(gf2.matvec(list(map(pack, mat)), pack(key)) for mat in KeyMatrices)
 
-    return row
-
-
-def invert_Matrix(matrix):  # -> vector<block>
-    # Copy of the matrix
-    mat = [block() for _ in range(blocksize)]
-    for i in range(blocksize):
-        for j in range(blocksize):
-            mat[i][j] = matrix[i][j]
-
-    # Initialize to hold the inverted matrix
-    invmat = [block() for _ in range(blocksize)]
-    for i in range(blocksize):
-        invmat[i][i] = 1
-
-    size = len(mat[0])
-
-    # Transform to upper triangular matrix
-    row = 0
-    for col in range(size):
-        if not mat[row][col]:
-            r = row + 1
-            while r < len(mat) and not mat[r][col]:
-                r = r + 1
-
-            if r >= len(mat):
-                continue
-            else:
-                temp = mat[row]
-                mat[row] = mat[r]
-                mat[r] = temp
-                temp = invmat[row]
-                invmat[row] = invmat[r]
-                invmat[r] = temp
-
-        for i in range(row + 1, len(mat)):
-            if mat[i][col]:
-                mat[i] = xor_block(mat[i], mat[row])
-                invmat[i] = xor_block(invmat[i], invmat[row])
-
-        row = row + 1
-
-
-    # Transform to identity matrix
-    for col in reversed(range(size)):
-            for r in range(col):
-                if mat[r][col]:
-                    mat[r] = xor_block(mat[r], mat[col])
-                    invmat[r] = xor_block(invmat[r], invmat[col])
-
-    return invmat
-
-
-#
-# Pseudorandom bits
-#
-
-def getrandblock():  # -> block
-    return [getrandbit() for i in range(blocksize)]
-
-
-def getrandkeyblock():  # -> keyblock
-    return [getrandbit() for i in range(keysize)]
-
-
-# Uses the Grain LSFR as self-shrinking generator to create pseudorandom bits
-# Is initialized with the all 1s state
-# The first 160 bits are thrown away
-def getrandbit():  # -> bool
-    global state
-    tmp = 0
-
-    # If state has not been initialized yet
-    if state is None:
-        state = bitset(80, 1)  # Initialize with all bits set
+    return
 
-        # Throw the first 160 bits away
-        for _ in range(160):
-            # Update the state
-            tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-            state = state[1:] + [0]
-            state[79] = tmp
 
-    # Choice records whether the first bit is 1 or 0.
-    # The second bit is produced if the first bit is 1.
-    while True:
-        # Update the state
-        tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-        state = state[1:] + [0]
-        state[79] = tmp
-        choice = tmp
-        tmp = state[0] ^ state[13] ^ state[23] ^ state[38] ^ state[51] ^ state[62]
-        state = state[1:] + [0]
-        state[79] = tmp
+def instantiate_LowMC(seed=None):  # -> void
+    # Load the instance tables, which are only generated on first use
+    instance = LowMC_instance.load(blocksize, keysize, numofboxes, rounds, seed=seed)
 
-        if choice:
-            break
+    LinMatrices[:] = [[unpack(row) for row in mat] for mat in instance.LinMatrices]
+    invLinMatrices[:] = [[unpack(row) for row in mat] for mat in instance.invLinMatrices]
+    roundconstants[:] = [unpack(row) for row in instance.roundconstants]
+    KeyMatrices[:] = [[unpack(row, keysize) for row in mat] for mat in instance.KeyMatrices]
 
-    return tmp
+    packedLinMatrices[:] = instance.LinMatrices
+    packedInvLinMatrices[:] = instance.invLinMatrices
+    packedRoundconstants[:] = instance.roundconstants
+    packedLinTables[:] = [gf2.matvec_tables(mat, blocksize) for mat in instance.LinMatrices]
+    packedInvLinTables[:] = [gf2.matvec_tables(mat, blocksize) for mat in instance.invLinMatrices]
 
 
 instantiate_LowMC()
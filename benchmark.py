@@ -0,0 +1,65 @@
+# Benchmarks of challenge absorption on the view stream of a circuit, run
+# natively (on bits as ints) so only the absorption itself is measured, and
+# of Beaver triple generation for the ANDs of the circuit
+#
+#   python benchmark.py [circuit] [--parties N]
+
+import argparse
+import time
+
+import bristol
+from LowMC import init_encrypt, xor_block
+from mpc_in_the_head import garbled_size, generate_triple
+import challenge
+import randomness
+
+parser = argparse.ArgumentParser(description="Benchmark challenge absorption.")
+parser.add_argument("in_path", nargs="?", default="sample_circuits/mul64.txt")
+parser.add_argument("--parties", type=int, default=3)
+parser.add_argument("--seed", type=int, default=0, help="seed of the random views and triples")
+args = parser.parse_args()
+
+n = args.parties
+ands = garbled_size(bristol.lazy_circuit(args.in_path))
+encrypt = init_encrypt(lambda b: b, list)
+pool = randomness.pool(seed=args.seed)
+view = [(pool.randbits(2*n+5) >> i) & 1 for i in range(2*n+5)]
+
+def sliced(gate_count):  # Queue sliced once per gate, as emulate did before
+    (bitqueue, chosen_indices, count) = ([], [0]*128, 0)
+    for _ in range(gate_count):
+        for _ in range(n):
+            bitqueue.extend(view)
+        if len(bitqueue) >= 128:
+            (preimage, bitqueue) = (bitqueue[0:128], bitqueue[128:])
+            chosen_indices = xor_block(chosen_indices, encrypt(preimage))
+            count += 1
+    return count
+
+def chunked(gate_count):
+    fiat_shamir = challenge.stage(encrypt, lambda b: b)
+    for _ in range(gate_count):
+        for _ in range(n):
+            fiat_shamir.absorb(view)
+    fiat_shamir.derive()
+    return fiat_shamir.count
+
+print(args.in_path + ": " + str(ands) + " ANDs, " + str(n*(2*n+5)) + " view bits per AND")
+for (name, absorb) in [("sliced", sliced), ("chunked", chunked)]:
+    for fraction in (4, 2, 1):
+        gate_count = ands // fraction
+        start = time.perf_counter()
+        count = absorb(gate_count)
+        seconds = time.perf_counter() - start
+        print(" * " + name + ": " + str(gate_count) + " ANDs, " + str(count) + " blocks encrypted in " +
+              "{:.2f}s ({:.1f}us per view bit)".format(seconds, 1e6 * seconds / (gate_count * n * (2*n+5))))
+
+for (name, triple) in [
+    ("randbits(1) per bit", lambda: generate_triple(n, constant=int)),
+    ("pool", lambda: pool.triple(n, int))
+]:
+    start = time.perf_counter()
+    for _ in range(ands):
+        triple()
+    seconds = time.perf_counter() - start
+    print(" * triples from " + name + ": " + str(ands) + " in {:.2f}s".format(seconds))
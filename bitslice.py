@@ -0,0 +1,105 @@
+from circuit import op
+from bristol import gates, layout
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; Python ints are used without it
+    numpy = None
+
+
+#
+# Flat gate tables
+#
+
+class gate_table():
+    """
+    Flat table of `(op, in1, in2, out)` gates for evaluating a circuit on
+    many inputs at once.  Accepts any circuit that `bristol.gates` accepts.
+    """
+    def __init__(self, circ):
+        (_, self.wire_count, self.value_in_length, self.value_out_length, self.wire_out_index) = layout(circ)
+        self.wire_in_count = sum(self.value_in_length)
+        self.gate = list(gates(circ))
+
+    def evaluate(self, inputs, use_numpy=False):
+        """Evaluate the circuit on a list of input bit vectors."""
+        lanes = len(inputs)
+        if use_numpy:
+            words = self.evaluate_packed(pack_numpy(inputs, self.wire_in_count), lanes)
+            return unpack_numpy(words, lanes)
+        return unpack(self.evaluate_packed(pack(inputs, self.wire_in_count), lanes), lanes)
+
+    def evaluate_packed(self, words, lanes):
+        """
+        Evaluate the circuit on bit-sliced inputs: one word per input wire
+        (a Python int or a NumPy `uint64` array) holding bit `j` of every
+        lane `j`.  Returns one word per output wire.
+        """
+        if numpy is not None and isinstance(words, numpy.ndarray):
+            mask = numpy.full(words.shape[1:], numpy.uint64(2**64 - 1))
+            wire = numpy.zeros((self.wire_count,) + words.shape[1:], numpy.uint64)
+            wire[0:self.wire_in_count] = words
+        else:
+            mask = (1 << lanes) - 1
+            wire = list(words) + [0]*(self.wire_count - self.wire_in_count)
+
+        for (o, a, b, c) in self.gate:
+            if o == op.xor_:
+                wire[c] = wire[a] ^ wire[b]
+            elif o == op.and_:
+                wire[c] = wire[a] & wire[b]
+            elif o == op.not_:
+                wire[c] = wire[a] ^ mask
+            elif o == op.or_:
+                wire[c] = wire[a] | wire[b]
+            elif o == op.id_:
+                wire[c] = wire[a]
+            elif o == op.xnor_:
+                wire[c] = wire[a] ^ wire[b] ^ mask
+            elif o == op.nand_:
+                wire[c] = (wire[a] & wire[b]) ^ mask
+            elif o == op.nor_:
+                wire[c] = (wire[a] | wire[b]) ^ mask
+            elif o == op.nimp_:
+                wire[c] = wire[a] & (wire[b] ^ mask)
+            elif o == op.nif_:
+                wire[c] = (wire[a] ^ mask) & wire[b]
+            else:  # Remaining operations, from their truth tables
+                (x, y) = (wire[a], wire[b])
+                (nx, ny) = (x ^ mask, y ^ mask)
+                terms = [nx & ny, nx & y, x & ny, x & y]
+                wire[c] = mask & 0
+                for (t, term) in zip(o, terms):
+                    if t:
+                        wire[c] = wire[c] | term
+
+        return [wire[i] for i in self.wire_out_index]
+
+
+#
+# Packing of input and output vectors
+#
+
+def pack(vectors, width):
+    """Pack bit vectors into one Python int per wire (bit `j` from vector `j`)."""
+    words = [0]*width
+    for (j, v) in enumerate(vectors):
+        for i in range(width):
+            if v[i]:
+                words[i] |= 1 << j
+    return words
+
+def unpack(words, lanes):
+    """Unpack one Python int per wire into the original bit vectors."""
+    return [[(w >> j) & 1 for w in words] for j in range(lanes)]
+
+def pack_numpy(vectors, width):
+    """Pack bit vectors into a `uint64` array of shape (wires, words)."""
+    bits = numpy.zeros((width, -(-len(vectors) // 64) * 64), numpy.uint8)
+    bits[:, 0:len(vectors)] = numpy.array(vectors, numpy.uint8)[:, 0:width].T
+    return numpy.packbits(bits, axis=1, bitorder='little').view(numpy.uint64)
+
+def unpack_numpy(words, lanes):
+    """Unpack a `uint64` array of shape (wires, words) into bit vectors."""
+    bits = numpy.unpackbits(numpy.asarray(words).view(numpy.uint8), axis=1, bitorder='little')
+    return bits[:, 0:lanes].T.tolist()
@@ -0,0 +1,199 @@
+import io
+import gzip
+import bz2
+import lzma
+import mmap
+from bfcl import operation
+
+
+#
+# Bristol Fashion tokens
+#
+
+# Operation token lookup (the same tokens `bfcl` emits), keyed by truth table
+tokens = {tuple(o): t for (t, o) in operation.token_op_pairs}
+
+# Operation lookup for parsing, including the common `EQW` wire copy
+operations = {t.encode(): o for (t, o) in operation.token_op_pairs}
+operations[b'EQW'] = operation.parse('LID')
+
+
+#
+# Lazy parsing
+#
+
+class lazy_circuit():
+    """
+    Bristol Fashion circuit file that is memory-mapped and parsed one gate
+    at a time.  Only the header is read up front; iterating over `gate`
+    yields compact `(op, in1, in2, out)` tuples (with `in2` set to `None`
+    for unary gates) straight from the mapped file.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            rows = []
+            while len(rows) < 3:
+                row = m.readline().split()
+                if len(row) > 0:
+                    rows.append([int(t) for t in row])
+            self.offset = m.tell()
+
+        (self.gate_count, self.wire_count) = rows[0][0:2]
+        self.value_in_count = rows[1][0]
+        self.value_in_length = rows[1][1:]
+        self.value_out_count = rows[2][0]
+        self.value_out_length = rows[2][1:]
+        self.wire_in_count = sum(self.value_in_length)
+        self.wire_out_count = sum(self.value_out_length)
+
+    @property
+    def gate(self):
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            m.seek(self.offset)
+            count = 0
+            for line in iter(m.readline, b""):
+                if count == self.gate_count:
+                    break
+                t = line.split()
+                if len(t) == 0:
+                    continue
+                count += 1
+                if t[0] == b'2':
+                    yield (operations[t[5].upper()], int(t[2]), int(t[3]), int(t[4]))
+                else:
+                    yield (operations[t[4].upper()], int(t[2]), None, int(t[3]))
+
+class listed_circuit():
+    """
+    Bristol Fashion circuit held in memory as a list of the same compact
+    `(op, in1, in2, out)` tuples that a `lazy_circuit` yields, for circuits
+    built or rewritten in Python (see `minimize`).
+    """
+    def __init__(self, gate, wire_count, value_in_length, value_out_length):
+        self.gate = gate
+        self.gate_count = len(gate)
+        self.wire_count = wire_count
+        self.value_in_count = len(value_in_length)
+        self.value_in_length = list(value_in_length)
+        self.value_out_count = len(value_out_length)
+        self.value_out_length = list(value_out_length)
+        self.wire_in_count = sum(self.value_in_length)
+        self.wire_out_count = sum(self.value_out_length)
+
+
+def gates(circ):
+    """
+    Gates of a lazy, listed or `bfcl` circuit, or of a circuit synthesized
+    with `circuitry`, as `(op, in1, in2, out)` tuples.
+    """
+    if isinstance(circ, (lazy_circuit, listed_circuit)):
+        return circ.gate
+    if not hasattr(circ, 'value_in_length'):  # Circuit synthesized with `circuitry`
+        return (
+            (
+                g.operation, g.inputs[0].index,
+                g.inputs[1].index if len(g.inputs) > 1 else None,
+                g.index
+            )
+            for g in circ.gate if len(g.inputs) > 0
+        )
+    return (
+        (
+            g.operation, g.wire_in_index[0],
+            g.wire_in_index[1] if len(g.wire_in_index) > 1 else None,
+            g.wire_out_index[0]
+        )
+        for g in circ.gate
+    )
+
+
+def layout(circ):  # -> (int, int, list, list, list)
+    """
+    Header of any circuit that `gates` accepts, as `(gate_count, wire_count,
+    value_in_length, value_out_length)`, followed by the indices of its
+    output wires.  A synthesized circuit has one input and one output value.
+    """
+    if hasattr(circ, 'value_in_length'):  # Parsed Bristol Fashion circuit
+        outputs = list(range(circ.wire_count - circ.wire_out_count, circ.wire_count))
+        return (circ.gate_count, circ.wire_count, circ.value_in_length, circ.value_out_length, outputs)
+    wire_count = len(circ.gate)
+    gate_count = circ.count(lambda g: len(g.inputs) > 0)
+    outputs = [g.index for g in circ.gate if len(g.outputs) == 0]
+    return (gate_count, wire_count, [wire_count - gate_count], [len(outputs)], outputs)
+
+
+def last_reads(gate, outputs):  # -> dict
+    """
+    Index of the last of the `(op, in1, in2, out)` gates in `gate` to read
+    each wire, after which the wire is dead; the wires in `outputs` stay
+    live past the last gate.  Wires that are never read are left out.
+    """
+    last = {}
+    k = -1
+    for (k, (_, a, b, _)) in enumerate(gate):
+        last[a] = k
+        if b is not None:
+            last[b] = k
+    for w in outputs:
+        last[w] = k + 1
+    return last
+
+
+#
+# Output files
+#
+
+# Streaming codecs from the standard library, keyed by name and file suffix
+codecs = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+def open_output(path, compression=None, buffer_size=1 << 20):
+    """Open a buffered binary writer for `path`, optionally compressed."""
+    if compression is None:
+        compression = path.split(".")[-1] if path.split(".")[-1] in codecs else None
+    if compression is None:
+        return open(path, 'wb', buffering=buffer_size)
+    if compression not in codecs:
+        raise ValueError("unsupported compression '" + str(compression) + "'")
+    return io.BufferedWriter(codecs[compression](path, 'wb'), buffer_size)
+
+
+#
+# Streaming emission
+#
+
+def header(gate_count, wire_count, value_in_length, value_out_length):
+    return [
+        str(gate_count) + " " + str(wire_count),
+        " ".join(map(str, [len(value_in_length)] + list(value_in_length))),
+        " ".join(map(str, [len(value_out_length)] + list(value_out_length)))
+    ]
+
+def gate_line(wire_in_index, wire_out_index, o):
+    return " ".join([
+        str(len(wire_in_index)), "1",
+        " ".join(map(str, wire_in_index)), str(wire_out_index),
+        tokens[tuple(o)]
+    ])
+
+def emit(circ, file, progress=lambda _: _, chunk_size=1 << 14):
+    """
+    Write a circuit to a binary file handle in Bristol Fashion, `chunk_size`
+    gates at a time, without building the whole text in memory.  Accepts
+    any circuit that `gates` accepts.
+    """
+    lines = header(*layout(circ)[0:4])
+    gate_lines = (
+        gate_line([i for i in (in1, in2) if i is not None], out, o)
+        for (o, in1, in2, out) in progress(gates(circ))
+    )
+
+    file.write(("\n".join(lines) + "\n").encode())
+    chunk = []
+    for line in gate_lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            file.write(("\n".join(chunk) + "\n").encode())
+            chunk.clear()
+    if len(chunk) > 0:
+        file.write(("\n".join(chunk) + "\n").encode())
@@ -0,0 +1,88 @@
+# Fiat-Shamir challenge stage: views are compressed in blocks while the
+# circuit is emulated, and the challenge is derived from all of them at the end
+
+from circuitry import constant
+from LowMC import xor_block, keysize
+
+modes = ['chain', 'wide', 'tree']
+
+
+class stage:
+    """
+    Collects view bits in blocks and derives the 128 bit challenge from them
+    once every view is known, with `encrypt` (LowMC) as the compression
+    function.  The final partial block is padded with a 1 followed by 0s.
+    Each full block is compressed as soon as it is absorbed, so a stage only
+    holds its running state rather than every view.  Each mode needs one
+    LowMC instance per block:
+
+    * `chain`: 128 bit blocks chained as `E(s ^ m) ^ s ^ m`, so that the
+      order of the blocks matters and the same change to two blocks does
+      not cancel out, as it would in a plain XOR of their encryptions.
+    * `wide`: blocks of 128 + `keysize` bits, the extra bits being used as
+      the key of the instance, chained as `E_k(s ^ m) ^ s ^ m`.  This takes
+      fewer (AND heavy) instances for the same views, at the cost of the
+      XORs of a key schedule in each.
+    * `tree`: 128 bit blocks reduced pairwise as `E(l) ^ r`, with one
+      final encryption of the root, so the order of the blocks matters.
+      Complete subtrees are reduced as they fill up, and the rest from the
+      right when the challenge is derived.
+    """
+    def __init__(self, encrypt, constant=constant, mode='chain'):
+        if mode not in modes:
+            raise ValueError("challenge mode must be one of: " + ", ".join(modes))
+        self.encrypt = encrypt
+        self.constant = constant
+        self.mode = mode
+        self.rate = 128 + (keysize if mode == 'wide' else 0)
+        self.state = [0]*128  # Running value of the `chain` and `wide` modes
+        self.subtrees = []  # Roots of the complete subtrees of the `tree` mode, with their heights
+        self.block = []  # Bits absorbed since the last full block
+        self.count = 0  # LowMC instances used
+
+    def absorb(self, bits):  # -> void
+        i = 0
+        while len(self.block) + len(bits) - i >= self.rate:
+            j = i + self.rate - len(self.block)
+            self.compress(self.block + bits[i:j])
+            self.block = []
+            i = j
+        self.block.extend(bits[i:])
+
+    def E(self, message, key=None):  # -> list
+        self.count += 1
+        return self.encrypt(message, key)
+
+    def compress(self, block):  # -> void
+        if self.mode == 'chain':
+            x = xor_block(self.state, block)
+            self.state = xor_block(self.E(x), x)
+
+        if self.mode == 'wide':
+            x = xor_block(self.state, block[0:128])
+            self.state = xor_block(self.E(x, block[128:]), x)
+
+        if self.mode == 'tree':
+            (height, root) = (0, block)
+            while len(self.subtrees) > 0 and self.subtrees[-1][0] == height:
+                (height, left) = self.subtrees.pop()
+                (height, root) = (height + 1, xor_block(self.E(left), root))
+            self.subtrees.append((height, root))
+
+    def derive(self):  # -> list
+        if len(self.block) > 0:
+            padding = [self.constant(1)] + [self.constant(0)]*(self.rate - len(self.block) - 1)
+            self.compress(self.block + padding)
+            self.block = []
+
+        challenge = self.state
+        if self.mode == 'tree':
+            challenge = [0]*128
+            if len(self.subtrees) > 0:
+                root = self.subtrees.pop()[1]
+                while len(self.subtrees) > 0:
+                    root = xor_block(self.E(self.subtrees.pop()[1]), root)
+                challenge = self.E(root)
+
+        (self.state, self.subtrees) = ([0]*128, [])
+        return challenge
@@ -0,0 +1,110 @@
+import os
+import sys
+import marshal
+import hashlib
+from circuit import op
+from bristol import lazy_circuit, last_reads
+from bitslice import gate_table
+
+version = 1  # Bump whenever the generated source changes
+
+
+#
+# Straight-line code generation
+#
+
+# Expressions over registers `a` and `b` (and the all-ones mask `m`)
+expressions = {
+    op.xor_: "{a} ^ {b}",
+    op.and_: "{a} & {b}",
+    op.not_: "{a} ^ m",
+    op.or_: "{a} | {b}",
+    op.id_: "{a}",
+    op.xnor_: "{a} ^ {b} ^ m",
+    op.nand_: "({a} & {b}) ^ m",
+    op.nor_: "({a} | {b}) ^ m",
+    op.nimp_: "{a} & ({b} ^ m)",
+    op.nif_: "({a} ^ m) & {b}",
+}
+
+def expression(o):
+    if o in expressions:
+        return expressions[o]
+    # Remaining operations, as the sum of their truth table's minterms
+    terms = ["({a} ^ m) & ({b} ^ m)", "({a} ^ m) & {b}", "{a} & ({b} ^ m)", "{a} & {b}"]
+    terms = ["(" + term + ")" for (t, term) in zip(o, terms) if t]
+    return " | ".join(terms) if len(terms) > 0 else "0"
+
+def source(table):
+    """
+    Python source for a function `evaluate(i, m=1)` that computes the circuit
+    over local variables.  A register is released after the last gate that
+    reads it and reused by the next gate, so the number of locals tracks the
+    number of live wires rather than the number of gates.
+    """
+    last = last_reads(table.gate, table.wire_out_index)
+
+    register = {w: w for w in range(table.wire_in_count)}
+    free = [w for w in reversed(range(table.wire_in_count)) if w not in last]
+    count = table.wire_in_count
+
+    lines = [
+        "def evaluate(i, m=1):",
+        "    (" + "".join("r" + str(w) + ", " for w in range(table.wire_in_count)) + ") = i",
+    ]
+    for (k, (o, a, b, c)) in enumerate(table.gate):
+        e = expression(o).format(
+            a="r" + str(register[a]),
+            b="r" + str(register[b]) if b is not None else None
+        )
+        for w in (a, b):
+            if w is not None and last.get(w) == k and w in register:
+                free.append(register.pop(w))
+        if len(free) == 0:
+            free.append(count)
+            count += 1
+        register[c] = free.pop()
+        lines.append("    r" + str(register[c]) + " = " + e)
+        if c not in last:  # Never read, so the register is free again
+            free.append(register.pop(c))
+
+    lines.append("    return [" + ", ".join("r" + str(register[w]) for w in table.wire_out_index) + "]")
+    return "\n".join(lines) + "\n"
+
+
+#
+# Compilation with an on-disk cache
+#
+
+def compile_circuit(path, cache=True):
+    """
+    Compile the Bristol Fashion circuit file at `path` into a Python function
+    that can be called like `circuit.evaluate` on a flat list of input bits,
+    or on bit-sliced words by also passing the all-ones mask `m`.  Compiled
+    code is cached in `__pycache__` beside the circuit file, keyed by a hash
+    of the file, so each circuit is only ever compiled once.
+    """
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[0:16]
+    cache_path = os.path.join(
+        os.path.dirname(os.path.abspath(path)), '__pycache__',
+        ".".join([os.path.basename(path), digest, sys.implementation.cache_tag, "v" + str(version), "marshal"])
+    )
+
+    if cache and os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            code = marshal.load(f)
+    else:
+        code = compile(source(gate_table(lazy_circuit(path))), path, 'exec')
+        if cache:
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with open(cache_path + ".tmp", 'wb') as f:
+                    marshal.dump(code, f)
+                os.replace(cache_path + ".tmp", cache_path)
+            except OSError:
+                pass  # Read-only circuit directory: compile again next time
+
+    namespace = {}
+    exec(code, namespace)
+    return namespace['evaluate']
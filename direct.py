@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+from circuit import op
+import bristol
+
+
+#
+# Wires written straight to a Bristol Fashion sink
+#
+
+class wire:
+    """
+    A wire in a circuit that is being emitted directly; a wire without an
+    index is a constant.  Constants are folded exactly as `bit_optimize` in
+    `synthesis.py` folds them, so no gate is emitted for them.
+    """
+    __slots__ = ('sink', 'index', 'value')
+
+    def __init__(self, sink, index=None, value=None):
+        self.sink = sink
+        self.index = index
+        self.value = value
+
+    def coerce(self, other):
+        return other if isinstance(other, wire) else wire(self.sink, value=other)
+
+    def __invert__(self):
+        if self.index is None:
+            return wire(self.sink, value=1-self.value)
+        return self.sink.gate(op.not_, self)
+
+    def __and__(self, other):
+        other = self.coerce(other)
+        (x, y) = (self, other) if self.index is None else (other, self)
+        if x.index is None:
+            return y if x.value == 1 else x
+        return self.sink.gate(op.and_, self, other)
+
+    def __or__(self, other):
+        other = self.coerce(other)
+        (x, y) = (self, other) if self.index is None else (other, self)
+        if x.index is None:
+            return y if x.value == 0 else x
+        return self.sink.gate(op.or_, self, other)
+
+    def __xor__(self, other):
+        other = self.coerce(other)
+        (x, y) = (self, other) if self.index is None else (other, self)
+        if x.index is None:
+            if y.index is None:
+                return wire(self.sink, value=x.value^y.value)
+            return y if x.value == 0 else ~y
+        if x.index == y.index:
+            return wire(self.sink, value=0)
+        return self.sink.gate(op.xor_, self, other)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+
+class sink:
+    """
+    Assigns wire indices to gates as they are created and appends their
+    Bristol Fashion lines to the output file.  The header, which depends on
+    the final gate and wire counts, is patched in by `close`.
+    """
+    def __init__(self, path, wire_in_count, compression=None, chunk_size=1 << 14):
+        self.wire_in_count = wire_in_count
+        self.wire_count = wire_in_count
+        self.file = bristol.open_output(path, compression)
+        # Uncompressed files get a padded header that is overwritten at the
+        # end; compressed streams cannot seek, so gates are spooled instead.
+        self.body = self.file if compression is None else tempfile.TemporaryFile()
+        if self.body is self.file:
+            self.file.write(self.header())
+        self.counts = {}
+        self.chunk = []
+        self.chunk_size = chunk_size
+
+    def header(self, gate_count=None, wire_count=None, wire_out_count=None):
+        """Header padded to a fixed width, so it can overwrite the placeholder."""
+        lines = ["", "", ""] if gate_count is None else bristol.header(
+            gate_count, wire_count, [self.wire_in_count], [wire_out_count]
+        )
+        return "".join(l.ljust(w) + "\n" for (l, w) in zip(lines, [41, 22, 22])).encode()
+
+    # Backend interface used by `mpc_emulate`
+    bits = list
+
+    def constant(self, value):
+        return value if isinstance(value, wire) else wire(self, value=value)
+
+    def constants(self, values):
+        return [self.constant(v) for v in values]
+
+    def inputs(self):
+        return [wire(self, i) for i in range(self.wire_in_count)]
+
+    def gate(self, o, *ins):
+        out = wire(self, self.wire_count)
+        self.wire_count += 1
+        self.counts[o] = self.counts.get(o, 0) + 1
+        self.chunk.append(bristol.gate_line([w.index for w in ins], out.index, o))
+        if len(self.chunk) == self.chunk_size:
+            self.flush()
+        return out
+
+    def flush(self):
+        if len(self.chunk) > 0:
+            self.body.write(("\n".join(self.chunk) + "\n").encode())
+            self.chunk.clear()
+
+    def close(self, outputs):
+        """Copy the outputs onto the last wires and write the header."""
+        # Constant outputs are derived from the first input wire.
+        zero = None
+        for (i, w) in enumerate(outputs):
+            if w.index is None:
+                if zero is None:
+                    zero = self.gate(op.xor_, wire(self, 0), wire(self, 0))
+                outputs[i] = zero if w.value == 0 else ~zero
+
+        # Output wires must come last, so each one is copied by two inverters
+        # (just as `circuitry` preserves an output bit that has other uses).
+        outputs = [~w for w in outputs]
+        outputs = [~w for w in outputs]
+        self.flush()
+
+        gate_count = self.wire_count - self.wire_in_count
+        head = self.header(gate_count, self.wire_count, len(outputs))
+        if self.body is self.file:
+            self.file.seek(0)
+            self.file.write(head)
+        else:
+            self.file.write(head)
+            self.body.seek(0)
+            shutil.copyfileobj(self.body, self.file)
+            self.body.close()
+        self.file.close()
+        return gate_count
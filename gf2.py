@@ -0,0 +1,186 @@
+# Linear algebra over GF(2), with each matrix row packed into an int (bit j
+# is column j), sped up by Method of Four Russians lookup tables
+
+import heapq
+from functools import reduce
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; batches fall back to the tables below
+    numpy = None
+
+
+#
+# Four Russians tables
+#
+
+def tables(rows, k=8):  # -> vector<vector<int>>
+    """
+    For each group of `k` consecutive rows, the XOR of every subset of the
+    group, indexed by the bits selecting the subset.
+    """
+    result = []
+    for g in range(0, len(rows), k):
+        table = [0]
+        for row in rows[g:g+k]:
+            table += [t ^ row for t in table]
+        result.append(table)
+    return result
+
+
+def combine(tables, x, k=8):  # -> int
+    """XOR of the rows selected by the bits of `x`, one lookup per `k` bits."""
+    mask = (1 << k) - 1
+    result = 0
+    for table in tables:
+        result ^= table[x & mask]
+        x >>= k
+    return result
+
+
+#
+# Matrix functions
+#
+
+def transpose(rows, ncols):  # -> vector<int>
+    return [
+        sum(((row >> j) & 1) << i for (i, row) in enumerate(rows))
+        for j in range(ncols)
+    ]
+
+
+def matvec(rows, v):  # -> int
+    """Product of the matrix with the vector `v` (bit i is row i's parity with `v`)."""
+    return sum(((row & v).bit_count() & 1) << i for (i, row) in enumerate(rows))
+
+
+def matvec_tables(rows, ncols, k=8):  # -> vector<vector<int>>
+    """Tables for repeated products with the same matrix, for use with `combine`."""
+    return tables(transpose(rows, ncols), k)
+
+
+def matvec_many(rows, ncols, vs):  # -> vector<int>
+    """Products of the matrix with many vectors, using NumPy if it is available."""
+    if numpy is None or len(vs) == 0:
+        ts = matvec_tables(rows, ncols)
+        return [combine(ts, v) for v in vs]
+
+    unpack = lambda xs, n: numpy.unpackbits(
+        numpy.frombuffer(b"".join(x.to_bytes((n + 7) // 8, 'little') for x in xs), numpy.uint8)
+            .reshape(len(xs), (n + 7) // 8),
+        axis=1, bitorder='little'
+    )[:, 0:n].astype(numpy.int32)
+    products = (unpack(vs, ncols) @ unpack(rows, ncols).T) & 1
+    packed = numpy.packbits(products.astype(numpy.uint8), axis=1, bitorder='little')
+    return [int.from_bytes(p.tobytes(), 'little') for p in packed]
+
+
+def rank(rows):  # -> unsigned
+    pivots = {}
+    for row in rows:
+        while row:
+            top = row.bit_length() - 1
+            if top not in pivots:
+                pivots[top] = row
+                break
+            row ^= pivots[top]
+    return len(pivots)
+
+
+def invert(rows, size, k=8):  # -> vector<int>
+    """
+    Inverse of a square matrix by Gauss-Jordan elimination on the matrix
+    augmented with the identity, `k` columns at a time: once the pivot rows
+    of a strip are reduced, every other row is cleared with one table lookup.
+    """
+    mat = [row | (1 << (size + i)) for (i, row) in enumerate(rows)]
+    for c0 in range(0, size, k):
+        w = min(k, size - c0)
+
+        # Find the strip's pivot rows and reduce them among themselves.
+        for j in range(w):
+            col = c0 + j
+            for r in range(col, size):
+                row = mat[r]
+                for i in range(j):
+                    if (row >> (c0 + i)) & 1:
+                        row ^= mat[c0 + i]
+                if (row >> col) & 1:
+                    break
+            else:
+                raise ValueError("matrix is not invertible")
+            (mat[r], mat[col]) = (mat[col], row)
+            for i in range(j):
+                if (mat[c0 + i] >> col) & 1:
+                    mat[c0 + i] ^= mat[col]
+
+        # Clear the strip from every other row.
+        table = tables(mat[c0:c0+w], w)[0]
+        mask = (1 << w) - 1
+        for r in range(size):
+            if not c0 <= r < c0 + w:
+                mat[r] ^= table[(mat[r] >> c0) & mask]
+
+    return [row >> size for row in mat]
+
+
+#
+# XOR networks for constant matrices
+#
+
+class xor_network:
+    """
+    Shared network of XORs computing the product of a constant matrix with
+    a vector, found with Paar's greedy heuristic: the pair of signals that
+    appears together in the most rows is replaced in all of them by a new
+    signal holding their XOR, until no pair is shared by two rows.  Pair
+    counts only ever drop for existing signals, so stale heap entries are
+    recounted when popped instead of being updated in place.
+    """
+    def __init__(self, rows, ncols):
+        self.ncols = ncols
+        self.gate = []  # Signal `ncols + k` is the XOR of the pair `gate[k]`
+        cols = transpose(rows, ncols)  # Rows each signal appears in
+
+        heap = []
+        for a in range(ncols):
+            for b in range(a + 1, ncols):
+                count = (cols[a] & cols[b]).bit_count()
+                if count > 1:
+                    heap.append((-count, a, b))
+        heapq.heapify(heap)
+
+        while heap:
+            (count, a, b) = heapq.heappop(heap)
+            shared = cols[a] & cols[b]
+            if shared.bit_count() != -count:
+                if shared.bit_count() > 1:
+                    heapq.heappush(heap, (-shared.bit_count(), a, b))
+                continue
+
+            s = len(cols)
+            cols[a] ^= shared
+            cols[b] ^= shared
+            cols.append(shared)
+            self.gate.append((a, b))
+            for x in range(s):
+                count = (shared & cols[x]).bit_count()
+                if count > 1:
+                    heapq.heappush(heap, (-count, x, s))
+
+        self.outputs = [  # Signals XORed together for each row
+            [x for x in range(len(cols)) if (cols[x] >> i) & 1]
+            for i in range(len(rows))
+        ]
+        self.naive_count = sum(max(row.bit_count() - 1, 0) for row in rows)
+        self.xor_count = len(self.gate) + sum(max(len(o) - 1, 0) for o in self.outputs)
+
+    def evaluate(self, xs, zero=0):  # -> vector
+        """Product with the vector `xs` of bits (or wires), with `zero` for empty rows."""
+        signals = list(xs)
+        for (a, b) in self.gate:
+            signals.append(signals[a] ^ signals[b])
+        return [
+            reduce(lambda x, y: x ^ y, [signals[x] for x in o]) if len(o) > 0 else zero
+            for o in self.outputs
+        ]
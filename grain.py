@@ -0,0 +1,56 @@
+# Grain LFSR used by LowMC to generate its matrices and constants,
+# operating on the 80 bit state as an int (bit i is state[i])
+
+# Self-shrinking of every byte of feedback bits: the second bit of each
+# pair is kept if the first bit is 1.  Maps a byte to (kept bits, count).
+shrink = []
+for byte in range(256):
+    (kept, count) = (0, 0)
+    for i in range(0, 8, 2):
+        if (byte >> i) & 1:
+            kept |= ((byte >> (i+1)) & 1) << count
+            count += 1
+    shrink.append((kept, count))
+
+
+class grain:
+    """
+    Grain LFSR used as a self-shrinking generator to create pseudorandom
+    bits.  It is initialized with the all 1s state (or with `seed`, an 80 bit
+    int) and the first 160 bits are thrown away, just as in LowMC.cpp.
+    """
+    def __init__(self, seed=None):
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        self.state = (1 << 80) - 1 if seed is None else seed
+        self.kept = 0  # Output bits generated but not yet handed out
+        self.count = 0
+        for _ in range(10):
+            self.step()
+
+    def step(self):
+        # Sixteen updates at once: no tap reaches a bit shifted in this step.
+        s = self.state
+        feedback = (s ^ (s >> 13) ^ (s >> 23) ^ (s >> 38) ^ (s >> 51) ^ (s >> 62)) & 0xFFFF
+        self.state = (s >> 16) | (feedback << 64)
+        return feedback
+
+    def getrandbits(self, n):  # -> int (bit i is the i-th bit generated)
+        while self.count < n:
+            feedback = self.step()
+            for byte in (feedback & 0xFF, feedback >> 8):
+                (kept, count) = shrink[byte]
+                self.kept |= kept << self.count
+                self.count += count
+        bits = self.kept & ((1 << n) - 1)
+        self.kept >>= n
+        self.count -= n
+        return bits
+
+    def getrandbit(self):  # -> bool
+        return self.getrandbits(1)
+
+    def getrandblock(self, n):  # -> list of n bits
+        bits = self.getrandbits(n)
+        return [(bits >> i) & 1 for i in range(n)]
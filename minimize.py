@@ -0,0 +1,320 @@
+# Reduction of the number of ANDs (the multiplicative complexity) of input
+# circuits before emulation: every AND costs a Beaver triple, views and its
+# share of the challenge, while XORs and NOTs are emulated for free
+
+from collections import Counter
+
+from circuit import op
+from bristol import gates, listed_circuit
+from mpc_in_the_head import and_forms
+
+#
+# XOR-AND graphs
+#
+
+class xag:
+    """
+    XOR-AND graph with structural hashing.  A literal is `2*node + c`, the
+    output of `node` complemented if `c` is 1; node 0 is the constant 0 and
+    nodes 1, ..., `inputs` are the inputs.  Complements only live on
+    literals, and the inputs of an XOR node are never complemented, so
+    identical subterms up to NOTs are the same node.
+    """
+    def __init__(self, inputs):
+        self.inputs = inputs
+        self.fanin = [None]*(inputs + 1)  # Literals `(a, b)` of each AND and XOR node
+        self.xor_node = [False]*(inputs + 1)
+        self.table = {}
+
+    def node(self, key):  # -> literal
+        if key not in self.table:
+            self.table[key] = 2 * len(self.fanin)
+            self.fanin.append(key[1:])
+            self.xor_node.append(key[0])
+        return self.table[key]
+
+    def and_(self, a, b):  # -> literal
+        (a, b) = (min(a, b), max(a, b))
+        if a == 0 or a ^ b == 1:
+            return 0
+        if a == 1 or a == b:
+            return b
+        return self.node((False, a, b))
+
+    def xor(self, a, b):  # -> literal
+        c = (a ^ b) & 1
+        (a, b) = sorted((a & ~1, b & ~1))
+        if a == b:
+            return c
+        if a == 0:
+            return b ^ c
+        return self.node((True, a, b)) ^ c
+
+    def gate(self, operation, a, b=None):  # -> literal
+        """Any unary or binary operation, from its algebraic normal form."""
+        t = tuple(operation)
+        if len(t) == 2:
+            return t[0] if t[0] == t[1] else a ^ t[0]
+        (c, q, p, r) = (t[0], t[0] ^ t[1], t[0] ^ t[2], t[0] ^ t[1] ^ t[2] ^ t[3])
+        if r:  # c ^ p*a ^ q*b ^ a*b
+            return self.and_(a ^ q, b ^ p) ^ c ^ (p & q)
+        z = c
+        z = self.xor(z, a) if p else z
+        z = self.xor(z, b) if q else z
+        return z
+
+    def ands(self):  # -> unsigned
+        return self.xor_node.count(False) - self.inputs - 1
+
+
+def from_gates(wire_in_count, wire_count, gate, wire_out_index):  # -> (xag, list)
+    """Graph of `(op, in1, in2, out)` gates on wires 0, ..., `wire_count`-1, the first `wire_in_count` being inputs."""
+    g = xag(wire_in_count)
+    wire = [2 * (i + 1) for i in range(wire_in_count)] + [None]*(wire_count - wire_in_count)
+    for (operation, in1, in2, out) in gate:
+        wire[out] = g.gate(operation, wire[in1], wire[in2] if in2 is not None else None)
+    return (g, [wire[i] for i in wire_out_index])
+
+
+def from_circuit(circ):  # -> (xag, list)
+    """Graph of a Bristol Fashion circuit, with the literals of its outputs."""
+    outputs = range(circ.wire_count - circ.wire_out_count, circ.wire_count)
+    return from_gates(circ.wire_in_count, circ.wire_count, gates(circ), outputs)
+
+
+def compact(g, outputs):  # -> (xag, list)
+    """Copy of the graph with only the nodes that reach an output."""
+    live = [False]*len(g.fanin)
+    for l in outputs:
+        live[l >> 1] = True
+    for v in reversed(range(g.inputs + 1, len(g.fanin))):
+        if live[v]:
+            for l in g.fanin[v]:
+                live[l >> 1] = True
+
+    h = xag(g.inputs)
+    lit = list(range(0, 2 * (g.inputs + 1), 2)) + [None]*(len(g.fanin) - g.inputs - 1)
+    mapped = lambda l : lit[l >> 1] ^ (l & 1)
+    for v in range(g.inputs + 1, len(g.fanin)):
+        if live[v]:
+            (a, b) = map(mapped, g.fanin[v])
+            lit[v] = h.xor(a, b) if g.xor_node[v] else h.and_(a, b)
+    return (h, [mapped(l) for l in outputs])
+
+#
+# Minimal implementations of functions of three inputs
+#
+
+variables = (0xAA, 0xCC, 0xF0)  # Truth tables of the inputs of a cut
+
+def affine(form, signals):  # -> int
+    (mask, c) = form
+    t = 0xFF * c
+    for (i, s) in enumerate(signals):
+        if (mask >> i) & 1:
+            t ^= s
+    return t
+
+_implementations = None
+
+def implementations():  # -> list
+    """
+    An implementation with the fewest ANDs of every function of three
+    inputs, indexed by truth table (every such function takes two at most).
+    Each is `(steps, out)`: the ANDs, as pairs of affine forms, computed in
+    turn, and the affine form of the output.  An affine form `(mask, c)`
+    XORs the signals selected by `mask` (the inputs and then the outputs of
+    the steps so far) and `c`.
+    """
+    global _implementations
+    if _implementations is not None:
+        return _implementations
+
+    table = [None]*256
+    for mask in range(8):
+        for c in (0, 1):
+            table[affine((mask, c), variables)] = ([], (mask, c))
+
+    forms = [(mask, c) for mask in range(1, 8) for c in (0, 1)]
+    firsts = []
+    for (i, l) in enumerate(forms):
+        for r in forms[i:]:
+            g = affine(l, variables) & affine(r, variables)
+            firsts.append(((l, r), g))
+            for mask in range(8):
+                for c in (0, 1):
+                    t = affine((mask | 8, c), variables + (g,))
+                    if table[t] is None:
+                        table[t] = ([(l, r)], (mask | 8, c))
+
+    for (step, g) in firsts:
+        if None not in table:
+            break
+        signals = variables + (g,)
+        values = {(mask, c): affine((mask, c), signals) for mask in range(1, 16) for c in (0, 1)}
+        for (l, x) in values.items():
+            if l[0] < 8:
+                continue  # The first AND must be an input of the second
+            for (r, y) in values.items():
+                h = x & y
+                for mask in range(16):
+                    for c in (0, 1):
+                        t = affine((mask | 16, c), signals + (h,))
+                        if table[t] is None:
+                            table[t] = ([step, (l, r)], (mask | 16, c))
+
+    _implementations = table
+    return table
+
+
+def build(g, implementation, leaves):  # -> literal
+    (steps, out) = implementation
+    signals = leaves + [0]*(3 - len(leaves))
+    def form(mask, c):
+        z = c
+        for (i, s) in enumerate(signals):
+            if (mask >> i) & 1:
+                z = g.xor(z, s)
+        return z
+    for (l, r) in steps:
+        signals.append(g.and_(form(*l), form(*r)))
+    return form(*out)
+
+#
+# Cut rewriting
+#
+
+def cone_table(g, v, cut):  # -> int
+    """Truth table of node `v` as a function of the nodes in `cut`."""
+    value = {0: 0}
+    value.update(zip(cut, variables))
+    def table(u):
+        if u not in value:
+            (a, b) = g.fanin[u]
+            (x, y) = (table(a >> 1) ^ (0xFF * (a & 1)), table(b >> 1) ^ (0xFF * (b & 1)))
+            value[u] = x ^ y if g.xor_node[u] else x & y
+        return value[u]
+    return table(v)
+
+
+def mffc_ands(g, refs, v, cut):  # -> unsigned
+    """ANDs that only `v` uses down to `cut`, which disappear if `v` is rebuilt from `cut`."""
+    touched = []
+    def dereference(u):
+        count = 0 if g.xor_node[u] else 1
+        for l in g.fanin[u]:
+            w = l >> 1
+            if w <= g.inputs or w in cut:
+                continue
+            refs[w] -= 1
+            touched.append(w)
+            if refs[w] == 0:
+                count += dereference(w)
+        return count
+    count = dereference(v)
+    for w in touched:
+        refs[w] += 1
+    return count
+
+
+def rewrite(g, outputs, cut_limit=8):  # -> (xag, list)
+    """
+    Rebuild the graph, replacing the cone of each node over one of its cuts
+    of three nodes at most by a minimal implementation, whenever that takes
+    fewer ANDs than the cone loses.
+    """
+    refs = Counter(l >> 1 for fanin in g.fanin[g.inputs+1:] for l in fanin)
+    refs.update(l >> 1 for l in outputs)
+    table = implementations()
+    cuts = [[()]] + [[(u,)] for u in range(1, g.inputs + 1)]
+
+    h = xag(g.inputs)
+    lit = list(range(0, 2 * (g.inputs + 1), 2))
+    mapped = lambda l : lit[l >> 1] ^ (l & 1)
+    for v in range(g.inputs + 1, len(g.fanin)):
+        (a, b) = g.fanin[v]
+        merged = set()
+        for x in cuts[a >> 1]:
+            for y in cuts[b >> 1]:
+                cut = tuple(sorted(set(x + y)))
+                if len(cut) <= 3:
+                    merged.add(cut)
+        cuts.append([(v,)] + sorted(merged, key=len)[:cut_limit])
+
+        (gain, best) = (0, None)
+        for cut in cuts[v][1:]:
+            implementation = table[cone_table(g, v, cut)]
+            saved = mffc_ands(g, refs, v, cut) - len(implementation[0])
+            if saved > gain:
+                (gain, best) = (saved, (implementation, cut))
+
+        if best is None:
+            lit.append(h.xor(mapped(a), mapped(b)) if g.xor_node[v] else h.and_(mapped(a), mapped(b)))
+        else:
+            (implementation, cut) = best
+            lit.append(build(h, implementation, [lit[u] for u in cut]))
+    return (h, [mapped(l) for l in outputs])
+
+#
+# Minimization
+#
+
+def to_circuit(g, outputs, value_in_length, value_out_length):  # -> listed_circuit
+    """
+    Bristol Fashion circuit for a compacted graph.  AND nodes become the
+    gate of `and_forms` that absorbs the complements of their inputs, and
+    a node used only by one output is emitted as that output, absorbing its
+    complement where a gate for it exists; other outputs are copies.
+    """
+    forms = {form: o for (o, form) in and_forms.items()}
+    xor_ops = (op.xor_, op.xnor_)
+    uses = Counter(l >> 1 for fanin in g.fanin[g.inputs+1:] for l in fanin)
+    once = Counter(l >> 1 for l in outputs)
+
+    def operation(v, c):  # -> op or None
+        if g.xor_node[v]:
+            return xor_ops[c]
+        (a, b) = g.fanin[v]
+        return forms.get((a & 1, b & 1, c))
+
+    deferred = {
+        l >> 1 for l in outputs
+        if l >> 1 > g.inputs and uses[l >> 1] == 0 and once[l >> 1] == 1
+        and operation(l >> 1, l & 1) is not None
+    }
+
+    gate = []
+    wire = list(range(-1, g.inputs)) + [None]*(len(g.fanin) - g.inputs - 1)
+    def emit(v, c):
+        (a, b) = g.fanin[v]
+        gate.append((operation(v, c), wire[a >> 1], wire[b >> 1], g.inputs + len(gate)))
+        return g.inputs + len(gate) - 1
+
+    for v in range(g.inputs + 1, len(g.fanin)):
+        if v not in deferred:
+            wire[v] = emit(v, 0)
+    for l in outputs:
+        (v, c) = (l >> 1, l & 1)
+        if v in deferred:
+            emit(v, c)
+        elif v == 0:  # Constant output, as `x ^ x` or its complement
+            gate.append((xor_ops[c], 0, 0, g.inputs + len(gate)))
+        else:
+            gate.append((op.not_ if c else op.id_, wire[v], None, g.inputs + len(gate)))
+    return listed_circuit(gate, g.inputs + len(gate), value_in_length, value_out_length)
+
+
+def minimize(circ, passes=4):  # -> listed_circuit
+    """
+    Circuit computing the same function as `circ` with fewer ANDs: shared
+    subterms are merged by structural hashing, and cones over cuts of three
+    nodes are rewritten with their minimal implementations for up to
+    `passes` rounds, while the AND count keeps falling.
+    """
+    (g, outputs) = compact(*from_circuit(circ))
+    for _ in range(passes):
+        (h, rewritten) = compact(*rewrite(g, outputs))
+        if h.ands() >= g.ands():
+            break
+        (g, outputs) = (h, rewritten)
+    return to_circuit(g, outputs, circ.value_in_length, circ.value_out_length)
@@ -1,15 +1,19 @@
-from functools import reduce
 from circuit import *
 from circuitry import *
+import circuitry
 from secrets import randbits
-from LowMC import init_encrypt, xor_block
+import hashlib
+from LowMC import init_encrypt
+from bristol import gates, layout, last_reads, tokens
+import challenge
+import randomness
 
 
 #
 # MPC primitives
 #
 
-def share(secret, n):
+def share(secret, n, constant=constant):
     shares = [None, secret] + [None]*(n-1)
     for i in range(2, n+1):
         shares[i] = constant(randbits(1))
@@ -22,11 +26,11 @@ def reconstruct(shares, n):
         secret = secret ^ shares[i]
     return secret
 
-def generate_triple(n, _a=None, _b=None):
+def generate_triple(n, _a=None, _b=None, constant=constant):
     _a = constant(randbits(1)) if not _a else _a
     _b = constant(randbits(1)) if not _b else _b
     _c = _a & _b
-    return list(zip(share(_a, n), share(_b, n), share(_c, n)))
+    return list(zip(share(_a, n, constant), share(_b, n, constant), share(_c, n, constant)))
 
 #
 # Emulated gates
@@ -69,84 +73,342 @@ def emulate_xor(xs, ys, n):
         zs[i] = xs[i] ^ ys[i]
     return zs, []
 
-def emulate_or(xs, ys, abc, n):
-    xys, views = emulate_and(xs, ys, abc, n)
-    ws, _views = emulate_xor(ys, xys, n)
-    zs, _views = emulate_xor(xs, ws, n)
-    return zs, views
-
 def emulate_not(xs, n):
-    zs = [None]*(n+1)
-    for i in range(1, n+1):
-        zs[i] = ~xs[i]
+    zs = xs[:]
+    zs[1] = ~xs[1]  # Flipping one share flips the secret, whatever the parity of `n`
     return zs, []
 
+def emulate_xnor(xs, ys, n):
+    zs, _views = emulate_xor(xs, ys, n)
+    return emulate_not(zs, n)
+
 def emulate_id(xs, _n):
     return xs, []
 
+# Nonlinear gates as one AND of the inputs, each flipped or not, flipped
+# or not: `(x ^ fx) & (y ^ fy) ^ fz` for the flips `(fx, fy, fz)`
+and_forms = {
+    op.and_: (0, 0, 0),
+    op.nand_: (0, 0, 1),
+    op.or_: (1, 1, 1),
+    op.nor_: (1, 1, 0),
+    op.nimp_: (0, 1, 0),
+    op.nif_: (1, 0, 0),
+}
+
+def emulate_and_form(xs, ys, abc, n, form):
+    (fx, fy, fz) = form
+    xs = emulate_not(xs, n)[0] if fx else xs
+    ys = emulate_not(ys, n)[0] if fy else ys
+    zs, views = emulate_and(xs, ys, abc, n)
+    return (emulate_not(zs, n)[0] if fz else zs), views
+
+# Linear gates, emulated locally without views
+linear_gates = {
+    op.xor_: lambda xs, ys, n : emulate_xor(xs, ys, n),
+    op.xnor_: lambda xs, ys, n : emulate_xnor(xs, ys, n),
+    op.not_: lambda xs, _ys, n : emulate_not(xs, n),
+    op.id_: lambda xs, _ys, n : emulate_id(xs, n),
+}
+
+#
+# Cut and choose
+#
+
+def mux(s, x, y):
+    return x ^ (s & (x ^ y))  # `x` if `s` is 0, else `y`
+
+def opening_record(views, n, seeded):  # -> tuple
+    """
+    The bits of the `n` views of an emulated AND that the proof can open,
+    kept instead of the views once they have been committed to: the seeds
+    replace all but the hidden party's broadcast `d` and `e` and party
+    `n`'s share of `c` if `seeded`, and otherwise every party's `a`, `b`,
+    `c`, `x` and `y` with the broadcast `d` and `e` values held once.
+    """
+    (first, last) = (views[1], views[n])
+    if seeded:
+        return (first[5], first[5+n], last[4+n], last[4+2*n], last[2])
+    return ([None] + [view[0:5] for view in views[1:]], first[5:5+n], first[5+n:])
+
+def select_views(records, e, n):
+    """
+    Reveal the views of parties 1+e, ..., n-1+e, chosen by the challenge bit
+    `e`, given the `opening_record` of each emulated AND in order.  Every
+    bit costs one mux, except for bits that all parties share (the broadcast
+    `d` and `e` values), which are the same in every view.
+    """
+    return [
+        b
+        for j in range(n-1)
+        for (own, ds, es) in records
+        for b in [mux(e, x, y) for (x, y) in zip(own[1+j], own[2+j])] + ds + es
+    ]
+
+def hidden_commitment(commitments, e, n):
+    """Commitment of the party left unopened by `e`: party `n` if `e` is 0, else party 1."""
+    return [mux(e, x, y) for (x, y) in zip(commitments[n], commitments[1])]
+
+def open_keys(keys, e, n):
+    """Commitment keys (one set of `commitment_keys`) of parties 1+e, ..., n-1+e."""
+    return [mux(e, x, y) for j in range(1, n) for (x, y) in zip(keys[j], keys[j+1])]
+
+def open_views(records, inputs, keys, commitments, e, n):
+    """
+    The views chosen by `select_views`, followed by the input shares of the
+    same parties (from the shares `[None, s1, ..., sn]` of each input wire),
+    their keys from each set in `keys` and the hidden party's commitment
+    from each set in `commitments` (to its views, then to its triples), so
+    that a verifier can re-run the opened parties and recompute the
+    challenges.
+    """
+    opened = select_views(records, e, n)
+    opened += [mux(e, x[1+j], x[2+j]) for j in range(n-1) for x in inputs]
+    opened += [b for ks in keys for b in open_keys(ks, e, n)]
+    return opened + [b for digests in commitments for b in hidden_commitment(digests, e, n)]
+
+def open_seeded(records, keys, inputs, commitments, e, n):
+    """
+    Counterpart of `open_views` for parties whose randomness comes from
+    seeds (see `randomness.tapes`), from the seeded `opening_record` of each
+    emulated AND: the seeds of parties 1+e, ..., n-1+e (which are also
+    the keys of their commitments), party 1's input shares if it is opened (0s
+    otherwise), for each emulated AND the hidden party's broadcast `d` and
+    `e` followed by party `n`'s share of `c` if it is opened (0 otherwise),
+    and the hidden party's commitments.  Everything else in the opened
+    views can be recomputed from these.  The opened share of `c` is not
+    checked here but goes into party `n`'s commitment to its triples, which
+    the cut and choose on the preprocessing holds the prover to.
+    """
+    opened = open_keys(keys, e, n)
+    hidden_1 = ~e
+    opened += [x[1] & hidden_1 for x in inputs]
+    for (d_1, e_1, d_n, e_n, c_n) in records:
+        opened += [mux(e, d_n, d_1), mux(e, e_n, e_1), c_n & e]
+    return opened + [b for digests in commitments for b in hidden_commitment(digests, e, n)]
+
+def open_preprocessing(records, keys, n, seeded):  # -> list
+    """
+    What a verifier needs to recompute the commitment of every party to its
+    triples and to check that each triple has `c = a & b`, for a repetition
+    whose preprocessing is opened instead of its views: the `keys` of all
+    `n` parties (those of their commitments to their triples, or their
+    seeds if `seeded`), followed by party `n`'s share of `c` for each emulated AND if
+    `seeded` (the seeds give the rest), or else by the `a`, `b` and `c` of
+    each party in turn for each emulated AND.  None of it depends on the
+    inputs.
+    """
+    opened = [b for key in keys[1:] for b in key]
+    if seeded:
+        return opened + [c_n for (_, _, _, _, c_n) in records]
+    return opened + [b for i in range(1, n+1) for (own, _, _) in records for b in own[i][0:3]]
+
+def preprocessing_count(repetitions, preprocessing=None):  # -> unsigned
+    """
+    Number of repetitions whose preprocessing is opened: `preprocessing`,
+    or by default half of them rounded down.  At least one repetition must
+    stay online, or the proof would say nothing about the inputs.
+    """
+    count = repetitions // 2 if preprocessing is None else preprocessing
+    if not 0 <= count < repetitions:
+        raise ValueError(
+            "the preprocessing of at most " + str(repetitions - 1) + " of " + str(repetitions) +
+            " repetitions can be opened, not " + str(count)
+        )
+    return count
+
+def preprocessing_indices(opened, repetitions, count):  # -> list
+    """
+    The `count` repetitions whose preprocessing is opened, chosen by the
+    first challenge `opened` (128 bits, as ints): the repetitions are
+    ranked by SHAKE-128 of the challenge, so that the number opened is
+    fixed and only which ones are opened is left to the challenge.
+    """
+    digest = hashlib.shake_128(bytes(opened)).digest(8 * repetitions)
+    return sorted(sorted(range(repetitions), key=lambda r : digest[8*r:8*r+8])[0:count])
+
+def derive_preprocessing_challenge(commitments, fiat_shamir):  # -> list
+    """
+    The first challenge, from the commitment to the triples of each party
+    `i` in each repetition `r` (`commitments[r][i]`, 128 bits, keyed
+    independently of the commitments to the views), which picks the
+    repetitions whose preprocessing is opened (see `preprocessing_indices`
+    and `open_preprocessing`) instead of their views.  As the triples never
+    depend on the inputs, neither does this challenge.
+    """
+    for digests in commitments:
+        for bits in digests[1:]:
+            fiat_shamir.absorb(bits)
+    return fiat_shamir.derive()
+
+def derive_challenge(opened, preprocessed, commitments, output_shares, fiat_shamir):  # -> list
+    """
+    The challenge, from the preprocessing challenge `opened`, from the
+    commitment to the views of each party `i` in each repetition `r`
+    (`commitments[r][i]`, 128 bits, keyed with a secret of the party so
+    that it hides the view) and from each party's shares of the outputs
+    (`output_shares[r][i]`).  Repetitions whose preprocessing is opened (1
+    bits of `preprocessed`) contribute 0s instead, as nothing of their
+    views is revealed.  A verifier recomputes it from the opened parties
+    and the hidden commitments.
+    """
+    fiat_shamir.absorb(opened)
+    for (p, digests, shares) in zip(preprocessed, commitments, output_shares):
+        online = ~p
+        for bits in digests[1:] + shares[1:]:
+            fiat_shamir.absorb([b & online for b in bits])
+    return fiat_shamir.derive()
+
 #
 # Circuit emulation
 #
 
 def garbled_size(circ):
-    gates = circuit()
-    gates.gate = circ.gate
-    return gates.count(
-        lambda g: \
-            g.operation == op.and_ \
-            or g.operation == op.or_
-    )
+    return sum(1 for (o, _, _, _) in gates(circ) if o in and_forms)
+
+
+def randomness_sources(circ, ands, n, repetitions, pool, seeded):  # -> list
+    """Source of the shares and triples of each repetition, for a `circ` with `ands` ANDs."""
+    if not seeded:
+        return [pool] * repetitions
+    return [
+        randomness.tapes(
+            [None] + [pool.randbits(randomness.tapes.seed_size) for _ in range(n)],
+            circ.wire_in_count + 3 * ands + randomness.tapes.seed_size
+        )
+        for _ in range(repetitions)
+    ]
+
 
+def commitment_keys(sources, n, pool, seeded, constant):  # -> (list, list)
+    """
+    Keys `[None, k_1, ..., k_n]` of the commitments of each party in each
+    repetition, as bits: one set for the commitments to the views and one
+    for those to the triples.  If `seeded` they are the party's seed and
+    the tail of its tape (see `randomness.tapes.tail`), else fresh salts
+    from `pool`.  A commitment absorbs its key before anything else, so
+    that the commitments of the hidden party cannot be matched against
+    guesses, and the two keys are independent so that combining the two
+    commitments cannot cancel them out.
+    """
+    size = randomness.tapes.seed_size
+    if seeded:
+        keys = [(source.seeds, source.tail(size)) for source in sources]
+    else:
+        keys = [[[None] + [pool.randbits(size) for _ in range(n)] for _ in range(2)] for _ in sources]
+    bits = lambda ks : [None] + [[constant((k >> j) & 1) for j in range(size)] for k in ks[1:]]
+    return tuple([bits(pair[t]) for pair in keys] for t in range(2))
 
-state = None  # Keeps the 80 bit LSFR state
 
-def mpc_emulate(circ, n):
-    share_n = lambda x : share(x, n)
+def opened_size(circ, ands, n, seeded):  # -> unsigned
+    """Proof bits opened for each repetition, for a `circ` with `ands` ANDs."""
+    if seeded:
+        return (n-1) * randomness.tapes.seed_size + circ.wire_in_count + 3 * ands + 256
+    return ands * (2*n+5) * (n-1) + (n-1) * (circ.wire_in_count + 2 * randomness.tapes.seed_size) + 256
+
+
+def mpc_emulate(
+    circ, n, backend=circuitry, challenge_mode='chain', repetitions=1, pool=None, seeded=False, preprocessing=None
+):
+    """
+    Build the proof function for `circ`, with gates made by `backend`
+    (`circuitry`, or a `direct.sink`).  All `repetitions` of the MPC are
+    emulated in one walk of `circ`, with the preprocessing of `preprocessing`
+    of them opened by cut and choose; randomness comes from `pool`, as
+    seeds for each party's tape if `seeded`.
+    """
+    if not 1 <= repetitions <= 128:
+        raise ValueError("repetitions must be between 1 and 128 (one challenge bit each)")
+
+    (constant, constants) = (backend.constant, backend.constants)
+    pool = randomness.pool() if pool is None else pool
     reconstruct_n = lambda xs : reconstruct(xs, n)
 
-    proof_size = garbled_size(circ) * (2*n+5) * (n-1) + 128
+    ands = garbled_size(circ)
+    size = opened_size(circ, ands, n, seeded)
+    proof_size = size * repetitions + 256
+    count = preprocessing_count(repetitions, preprocessing)
 
     # , rand_bits
     def emulate(in_bits: bits(circ.wire_in_count)) -> bits(circ.wire_out_count + proof_size):
         encrypt = init_encrypt(constant, constants)
-        all_views = [bits([])]
-        bitqueue = bits([])
-        chosen_indices = [0]*128
-        RAM = [[None]*(n+1)]*circ.wire_count
-        RAM[0:circ.wire_in_count] = list(map(share_n, in_bits))
-
-        for gate in circ.gate:
-            in1, in2 = gate.wire_in_index
-            out = gate.wire_out_index[0]
-            if gate.operation == op.and_:
-                RAM[out], views = emulate_and(RAM[in1], RAM[in2], generate_triple(n), n)
-            if gate.operation == op.or_:
-                RAM[out], views = emulate_or(RAM[in1], RAM[in2], generate_triple(n), n)
-            if gate.operation == op.xor_:
-                RAM[out], views = emulate_xor(RAM[in1], RAM[in2], n)
-            if gate.operation == op.not_:
-                RAM[out], views = emulate_not(RAM[in1], n)
-            if gate.operation == op.id_:
-                RAM[out], views = emulate_id(RAM[in1], n)
-            if len(views) > 1:
-                all_views.extend(views[1:])
-                for j in range(n):
-                    bitqueue.extend(views[1+j])
-
-            if len(bitqueue) >= 128:# > (128-(2*n+5)):
-                preimage = bitqueue[0:128]
-                bitqueue = bitqueue[128:]
-                # Update random bits to use later in a Fiat-Shamir transformation
-                chosen_indices = xor_block(chosen_indices, encrypt(preimage))
-
-        # Cut and choose views for the proof
-        # chosen_views = [views[2*i+j] for i, j in zip(chosen_indices[:80], chosen_indices[80:])]
-        chosen_views = reduce(lambda v, sl: v.extend(sl) or v, [all_views[1::n],all_views[2::n]])
-
-        output = list(map(reconstruct_n, RAM[-circ.wire_out_count:]))
+        stage = lambda : challenge.stage(encrypt, constant, challenge_mode)
+        sources = randomness_sources(circ, ands, n, repetitions, pool, seeded)
+        (keys, triple_keys) = commitment_keys(sources, n, pool, seeded, constant)
+        commitments = [[None] + [stage() for _ in range(n)] for _ in range(repetitions)]
+        triple_commitments = [[None] + [stage() for _ in range(n)] for _ in range(repetitions)]
+        for r in range(repetitions):
+            for i in range(1, n+1):
+                commitments[r][i].absorb(keys[r][i])
+                triple_commitments[r][i].absorb(triple_keys[r][i])
+        records = [[] for _ in range(repetitions)]
+
+        RAM = [None]*circ.wire_count
+        RAM[0:circ.wire_in_count] = [
+            [sources[r].share(b, n, constant) for r in range(repetitions)]
+            for b in in_bits
+        ]
+        input_shares = RAM[0:circ.wire_in_count]
+
+        last_read = last_reads(gates(circ), layout(circ)[4])
+        for (k, (operation, in1, in2, out)) in enumerate(gates(circ)):
+            if operation not in and_forms and operation not in linear_gates:
+                raise ValueError("cannot emulate " + tokens.get(tuple(operation), "unknown") + " gates")
+            zs = [None]*repetitions
+            for r in range(repetitions):
+                (xs, ys) = (RAM[in1][r], RAM[in2][r] if in2 is not None else None)
+                if operation in and_forms:
+                    zs[r], views = emulate_and_form(xs, ys, sources[r].triple(n, constant), n, and_forms[operation])
+                else:
+                    zs[r], views = linear_gates[operation](xs, ys, n)
+                if len(views) > 1:
+                    records[r].append(opening_record(views, n, seeded))
+                    for i in range(1, n+1):
+                        # Update random bits to use later in a Fiat-Shamir transformation
+                        commitments[r][i].absorb(views[i])
+                        triple_commitments[r][i].absorb(views[i][0:3])
+            for w in (in1, in2):
+                if last_read.get(w) == k:
+                    RAM[w] = None
+            RAM[out] = zs
+
+        outputs = RAM[-circ.wire_out_count:]
+        digests = [[None] + [s.derive() for s in stages[1:]] for stages in commitments]
+        triple_digests = [[None] + [s.derive() for s in stages[1:]] for stages in triple_commitments]
+        output_shares = [
+            [None] + [[shares[r][i] for shares in outputs] for i in range(1, n+1)]
+            for r in range(repetitions)
+        ]
+        (first, fiat_shamir) = (stage(), stage())
+        opened = derive_preprocessing_challenge(triple_digests, first)
+        # A constant, as the triples are: the openings are chosen while the circuit is built
+        preprocessed = preprocessing_indices([b.value for b in opened], repetitions, count)
+        chosen_indices = derive_challenge(
+            opened, [constant(int(r in preprocessed)) for r in range(repetitions)], digests, output_shares, fiat_shamir
+        )
+        instances = first.count + fiat_shamir.count + sum(
+            s.count for stages in commitments + triple_commitments for s in stages[1:]
+        )
+        print(" * challenge derived with " + str(instances) + " LowMC instances (" + challenge_mode + ")")
+
+        # Cut and choose views (or the preprocessing) for the proof
+        chosen_views = []
+        for r in range(repetitions):
+            if r in preprocessed:
+                opening = open_preprocessing(records[r], keys[r] if seeded else triple_keys[r], n, seeded)
+                chosen_views += opening + [constant(0)]*(size - len(opening))
+                continue
+            hidden = [digests[r], triple_digests[r]]
+            inputs = [shares[r] for shares in input_shares]
+            if seeded:
+                chosen_views += open_seeded(records[r], keys[r], inputs, hidden, chosen_indices[r], n)
+            else:
+                chosen_views += open_views(records[r], inputs, [keys[r], triple_keys[r]], hidden, chosen_indices[r], n)
+
+        output = [reconstruct_n(shares[0]) for shares in outputs]
         o = ~(in_bits[0]|~in_bits[0])  # hack to prevent optimize the output while testing natively
-        proof = [o^b for b in reduce(lambda v, sl: v.extend(sl) or v, chosen_views) + chosen_indices]
+        proof = [o^b for b in chosen_views + opened + chosen_indices]
         print(proof_size, len(proof))
-        return bits(output + proof)
+        return backend.bits(output + proof)
 
     return emulate
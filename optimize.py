@@ -0,0 +1,28 @@
+# Optimization of synthesized proof circuits: constants are folded as gates
+# are created (see `bit_optimize` in `synthesis.py`), but chains of NOTs,
+# duplicate subterms and gates that reach no output are left behind
+
+from collections import Counter
+
+from bristol import gates
+from bitslice import gate_table
+from minimize import from_gates, compact, to_circuit
+
+
+def optimize(circ):  # -> listed_circuit
+    """
+    Circuit computing the same outputs as `circ` (a synthesized `circuit`,
+    or a parsed lazy, listed or `bfcl` circuit), rebuilt as an XOR-AND
+    graph (see `minimize.xag`): NOTs live on the edges, so NOT pairs cancel
+    and NOTs next to an XOR become an XNOR (or fold into AND-like gates of
+    `and_forms`), equal gates are merged, and gates that reach no output
+    are dropped.
+    """
+    table = gate_table(circ)
+    (g, outputs) = compact(*from_gates(table.wire_in_count, table.wire_count, table.gate, table.wire_out_index))
+    return to_circuit(g, outputs, table.value_in_length, table.value_out_length)
+
+
+def op_counts(circ):  # -> Counter
+    """Number of gates of each operation in any circuit that `bristol.gates` accepts."""
+    return Counter(tuple(o) for (o, _, _, _) in gates(circ))
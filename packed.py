@@ -0,0 +1,191 @@
+# MPC-in-the-head emulation run natively on shares packed into ints: bit
+# `r*n + i - 1` of a wire's int is the share of party `i` in repetition `r`.
+# The shares in `mpc_emulate` are wires of the proof circuit being built,
+# which cannot be packed into ints, so it keeps its per-party lists.
+
+from circuit import op
+from bristol import gates, layout, last_reads, lazy_circuit, tokens
+from LowMC import init_encrypt_packed
+from mpc_in_the_head import (
+    and_forms, garbled_size, opened_size, randomness_sources, commitment_keys, opening_record, open_views, open_seeded,
+    open_preprocessing, preprocessing_count, preprocessing_indices, derive_preprocessing_challenge, derive_challenge
+)
+import challenge
+import randomness
+
+
+class engine:
+    """
+    Emulated gates on the packed shares of `n` parties in every repetition.
+    Linear gates act on all shares with one int operation, and an AND
+    reconstructs its broadcast values for every repetition with `n` shifts.
+    The views of an AND are kept as the packed `(a, b, c, x, y, d, e)`.
+    """
+    def __init__(self, n, repetitions):
+        self.n = n
+        self.repetitions = repetitions
+        self.mask = (1 << (n * repetitions)) - 1
+        self.first = sum(1 << (r * n) for r in range(repetitions))  # Party 1 of every repetition
+        self.group = (1 << n) - 1
+
+    def pack(self, words):  # -> int
+        """Shares of every repetition, given as one `n` bit int each."""
+        return sum(w << (r * self.n) for (r, w) in enumerate(words))
+
+    def reconstruct(self, x):  # -> int (bit r*n is the secret of repetition r)
+        p = 0
+        for i in range(self.n):
+            p ^= x >> i
+        return p & self.first
+
+    def broadcast(self, x):  # -> int
+        """The secret of each repetition in every share of that repetition."""
+        return self.reconstruct(x) * self.group
+
+    def xor(self, x, y):  # -> int
+        return x ^ y
+
+    def not_(self, x):  # -> int
+        return x ^ self.first  # Party 1's share is flipped, as in `emulate_not`
+
+    def xnor(self, x, y):  # -> int
+        return x ^ y ^ self.first
+
+    def and_(self, x, y, triple):  # -> (int, tuple)
+        (a, b, c) = triple
+        (d, e) = (x ^ a, y ^ b)
+        (D, E) = (self.broadcast(d), self.broadcast(e))
+        z = c ^ (x & E) ^ (y & D) ^ (D & E & self.first)
+        return (z, (a, b, c, x, y, d, e))
+
+    def and_form(self, x, y, triple, form):  # -> (int, tuple)
+        """A gate of `and_forms`: the AND of `x` and `y`, each flipped or not, flipped or not."""
+        (fx, fy, fz) = form
+        (z, views) = self.and_(x ^ (self.first * fx), y ^ (self.first * fy), triple)
+        return (z ^ (self.first * fz), views)
+
+    def share(self, x, r, i):  # -> int
+        return (x >> (r * self.n + i - 1)) & 1
+
+    def views(self, record, r):  # -> list
+        """Views of the `n` parties in repetition `r`, as `emulate_and` gives them."""
+        (a, b, c, x, y, d, e) = [w >> (r * self.n) for w in record]
+        ds = [(d >> j) & 1 for j in range(self.n)]
+        es = [(e >> j) & 1 for j in range(self.n)]
+        return [
+            [(a >> i) & 1, (b >> i) & 1, (c >> i) & 1, (x >> i) & 1, (y >> i) & 1] + ds + es
+            for i in range(self.n)
+        ]
+
+
+def native_encrypt():  # -> function
+    """LowMC `encrypt` on lists of bits as ints, computed on packed blocks."""
+    encrypt = init_encrypt_packed()
+    pack = lambda bits : sum(b << i for (i, b) in enumerate(bits))
+    return lambda message, key=None : [
+        (c >> i) & 1 for c in [encrypt(pack(message), None if key is None else pack(key))]
+        for i in range(128)
+    ]
+
+
+def emulate(circ, n, in_bits, challenge_mode='chain', repetitions=1, pool=None, seeded=False, preprocessing=None):  # -> list
+    """
+    Native counterpart of `mpc_emulate`: the output and proof bits that the
+    proof circuit of `circ` gives on `in_bits` (for the same randomness from
+    `pool`), computed without synthesizing the proof circuit.
+    """
+    pool = randomness.pool() if pool is None else pool
+    count = preprocessing_count(repetitions, preprocessing)
+    shares = engine(n, repetitions)
+    ands = garbled_size(circ)
+    sources = randomness_sources(circ, ands, n, repetitions, pool, seeded)
+    (keys, triple_keys) = commitment_keys(sources, n, pool, seeded, int)
+
+    RAM = [None]*circ.wire_count
+    RAM[0:circ.wire_in_count] = [
+        shares.pack([sources[r].share_packed(b, n) for r in range(repetitions)])
+        for b in in_bits
+    ]
+    input_shares = RAM[0:circ.wire_in_count]
+
+    # Views and triples, committed to as they are made and in the same order as in `mpc_emulate`
+    encrypt = native_encrypt()
+    stage = lambda : challenge.stage(encrypt, int, challenge_mode)
+    commitments = [[None] + [stage() for _ in range(n)] for _ in range(repetitions)]
+    triple_commitments = [[None] + [stage() for _ in range(n)] for _ in range(repetitions)]
+    for r in range(repetitions):
+        for i in range(1, n+1):
+            commitments[r][i].absorb(keys[r][i])
+            triple_commitments[r][i].absorb(triple_keys[r][i])
+    records = [[] for _ in range(repetitions)]
+
+    last_read = last_reads(gates(circ), layout(circ)[4])
+    for (k, (operation, in1, in2, out)) in enumerate(gates(circ)):
+        if operation in and_forms:
+            triples = [sources[r].triple_packed(n) for r in range(repetitions)]
+            triple = tuple(shares.pack(words) for words in zip(*triples))
+            (z, record) = shares.and_form(RAM[in1], RAM[in2], triple, and_forms[operation])
+            for r in range(repetitions):
+                views = [None] + shares.views(record, r)
+                records[r].append(opening_record(views, n, seeded))
+                for i in range(1, n+1):
+                    commitments[r][i].absorb(views[i])
+                    triple_commitments[r][i].absorb(views[i][0:3])
+        elif operation == op.xor_:
+            z = shares.xor(RAM[in1], RAM[in2])
+        elif operation == op.xnor_:
+            z = shares.xnor(RAM[in1], RAM[in2])
+        elif operation == op.not_:
+            z = shares.not_(RAM[in1])
+        elif operation == op.id_:
+            z = RAM[in1]
+        else:
+            raise ValueError("cannot emulate " + tokens.get(tuple(operation), "unknown") + " gates")
+        for w in (in1, in2):
+            if last_read.get(w) == k:
+                RAM[w] = None
+        RAM[out] = z
+
+    outputs = RAM[-circ.wire_out_count:]
+    digests = [[None] + [s.derive() for s in stages[1:]] for stages in commitments]
+    triple_digests = [[None] + [s.derive() for s in stages[1:]] for stages in triple_commitments]
+    output_shares = [
+        [None] + [[shares.share(x, r, i) for x in outputs] for i in range(1, n+1)]
+        for r in range(repetitions)
+    ]
+    opened = derive_preprocessing_challenge(triple_digests, stage())
+    preprocessed = preprocessing_indices(opened, repetitions, count)
+    chosen_indices = derive_challenge(
+        opened, [int(r in preprocessed) for r in range(repetitions)], digests, output_shares, stage()
+    )
+
+    inputs = [[[None] + [shares.share(x, r, i) for i in range(1, n+1)] for x in input_shares] for r in range(repetitions)]
+    size = opened_size(circ, ands, n, seeded)
+    chosen_views = []
+    for r in range(repetitions):
+        hidden = [digests[r], triple_digests[r]]
+        if r in preprocessed:
+            opening = open_preprocessing(records[r], keys[r] if seeded else triple_keys[r], n, seeded)
+            chosen_views += opening + [0]*(size - len(opening))
+        elif seeded:
+            chosen_views += open_seeded(records[r], keys[r], inputs[r], hidden, chosen_indices[r], n)
+        else:
+            chosen_views += open_views(records[r], inputs[r], [keys[r], triple_keys[r]], hidden, chosen_indices[r], n)
+
+    output = [shares.reconstruct(x) & 1 for x in outputs]
+    return output + chosen_views + opened + chosen_indices
+
+
+def prove(circuit_file, inputs, n=3, **options):  # -> list
+    """
+    Output and proof bits of the proof circuit for the Bristol Fashion
+    circuit in `circuit_file` on `inputs` (one list of bits per input value,
+    or one flat list of bits), computed natively.  The `options` are those
+    of `mpc_emulate` other than the backend.
+    """
+    circ = lazy_circuit(circuit_file)
+    if len(inputs) > 0 and isinstance(inputs[0], (list, tuple)):
+        inputs = [b for value in inputs for b in value]
+    if len(inputs) != circ.wire_in_count:
+        raise ValueError("circuit takes " + str(circ.wire_in_count) + " input bits, not " + str(len(inputs)))
+    return emulate(circ, n, [int(b) for b in inputs], **options)
@@ -0,0 +1,123 @@
+# Random bits for sharing secrets and generating Beaver triples: a pool
+# filled in large blocks instead of one system call per bit, and per-party
+# tapes expanded from short seeds
+
+import random
+import hashlib
+import secrets
+
+
+class pool:
+    """
+    Random bits drawn `prefetch` bytes at a time from `secrets.token_bytes`,
+    or from a `random.Random` seeded with `seed` to make runs reproducible.
+    Shares and triples are computed on plain ints and only then wrapped with
+    the backend's `constant`.
+    """
+    def __init__(self, prefetch=1 << 12, seed=None):
+        self.prefetch = prefetch
+        self.token_bytes = secrets.token_bytes if seed is None else random.Random(seed).randbytes
+        self.buffer = 0  # Bits not yet handed out
+        self.available = 0
+
+    def randbits(self, k):  # -> int
+        while self.available < k:
+            block = int.from_bytes(self.token_bytes(self.prefetch), 'little')
+            self.buffer |= block << self.available
+            self.available += 8 * self.prefetch
+        bits = self.buffer & ((1 << k) - 1)
+        self.buffer >>= k
+        self.available -= k
+        return bits
+
+    def share(self, secret, n, constant):  # -> list
+        """Shares `[None, s1, ..., sn]` of the wire `secret`, one NOT at most."""
+        r = self.randbits(n - 1)
+        shares = [None, secret ^ constant(r.bit_count() & 1)]
+        shares.extend(constant((r >> i) & 1) for i in range(n - 1))
+        return shares
+
+    def share_packed(self, secret, n):  # -> int
+        """Shares of the bit `secret`, packed into an int (bit i-1 is party i's)."""
+        r = self.randbits(n - 1)
+        return (secret ^ (r.bit_count() & 1)) | (r << 1)
+
+    def triple(self, n, constant):  # -> list
+        """Shares of a random triple `c = a & b`, as `(a_i, b_i, c_i)` for each party `i`."""
+        return unpack_triple(self.triple_packed(n), n, constant)
+
+    def triple_packed(self, n):  # -> (int, int, int)
+        bits = self.randbits(3*n - 1)
+        (a, b) = (bits & 1, (bits >> 1) & 1)
+        mask = (1 << (n - 1)) - 1
+        return tuple(
+            (x ^ (r.bit_count() & 1)) | (r << 1)
+            for (x, r) in ((a, (bits >> 2) & mask), (b, (bits >> (n + 1)) & mask), (a & b, (bits >> (2*n)) & mask))
+        )
+
+
+def unpack_triple(triple, n, constant):  # -> list
+    bit = (constant(0), constant(1))
+    (a, b, c) = triple
+    return [(None, None, None)] + [
+        (bit[(a >> i) & 1], bit[(b >> i) & 1], bit[(c >> i) & 1])
+        for i in range(n)
+    ]
+
+
+class tapes:
+    """
+    Random tapes of `n` parties for one emulation, each expanded from its
+    own `seed` (a `seed_size` bit int) with SHAKE-128, so that a party's
+    randomness can be opened by revealing just its seed.  A tape holds one
+    bit for every share (party 1's is unused, its share being the secret
+    corrected by the others) and three for every triple (party `n`'s third
+    is unused, its share of `c` being a correction), and ends with the key
+    of the party's commitment to its triples (see `tail`).  No seed determines
+    that correction, so it is bound by party `n`'s commitment to its
+    triples and checked wherever the preprocessing is opened (see
+    `mpc_in_the_head.open_preprocessing`).  Any object with `share` and
+    `triple` methods like `pool` can be used in its place.
+    """
+    seed_size = 128
+
+    def __init__(self, seeds, length):
+        self.seeds = seeds  # [None, seed_1, ..., seed_n]
+        self.bytes = [None] + [
+            hashlib.shake_128(seed.to_bytes(tapes.seed_size // 8, 'little')).digest((length + 7) // 8)
+            for seed in seeds[1:]
+        ]
+        self.length = length
+        self.position = 0
+
+    def randbits(self, k):  # -> vector<int> (one int of k bits per party)
+        positions = range(self.position, self.position + k)
+        self.position += k
+        return [None] + [
+            sum(((tape[p >> 3] >> (p & 7)) & 1) << j for (j, p) in enumerate(positions))
+            for tape in self.bytes[1:]
+        ]
+
+    def tail(self, k):  # -> vector<int>
+        """The last `k` bits of every tape, past any that `share` and `triple` draw."""
+        (position, self.position) = (self.position, self.length - k)
+        bits = self.randbits(k)
+        self.position = position
+        return bits
+
+    def share(self, secret, n, constant):  # -> list
+        r = self.randbits(1)[2:]
+        return [None, secret ^ constant(sum(r) & 1)] + [constant(bit) for bit in r]
+
+    def share_packed(self, secret, n):  # -> int
+        r = self.randbits(1)
+        return (secret ^ (sum(r[2:]) & 1)) | sum(r[i] << (i - 1) for i in range(2, n + 1))
+
+    def triple(self, n, constant):  # -> list
+        return unpack_triple(self.triple_packed(n), n, constant)
+
+    def triple_packed(self, n):  # -> (int, int, int)
+        r = self.randbits(3)
+        (a, b, c) = ([(ri >> k) & 1 for ri in r[1:]] for k in range(3))
+        c[n-1] = ((sum(a) & 1) & (sum(b) & 1)) ^ (sum(c[0:n-1]) & 1)
+        return tuple(sum(x[i] << i for i in range(n)) for x in (a, b, c))
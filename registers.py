@@ -0,0 +1,77 @@
+# Register allocation for emitted circuits: wire indices are reused once the
+# wire is dead, so an evaluator needs memory for the live wires only rather
+# than one slot for every gate
+
+from bristol import listed_circuit, last_reads
+from bitslice import gate_table
+
+
+def depth_first(table):  # -> list
+    """
+    Gates of a `gate_table` reordered so that each output is computed in
+    turn, every gate right after the gates it reads (a depth-first walk from
+    the outputs), which shortens the lives of the wires in between.  Gates
+    that reach no output are left out.
+    """
+    producer = {g[3]: g for g in table.gate}
+    done = set(range(table.wire_in_count))
+    order = []
+    for w in table.wire_out_index:
+        stack = [w]
+        while len(stack) > 0:
+            c = stack[-1]
+            if c in done:
+                stack.pop()
+                continue
+            (_, a, b, _) = producer[c]
+            pending = [x for x in (a, b) if x is not None and x not in done]
+            if len(pending) > 0:
+                stack.extend(reversed(pending))
+            else:
+                done.add(c)
+                order.append(producer[c])
+                stack.pop()
+    return order
+
+
+def renumber(circ, reorder=True):  # -> listed_circuit
+    """
+    Copy of a circuit (a synthesized `circuit`, or a parsed lazy, listed or
+    `bfcl` circuit) in which a wire index is reused as soon as the wire it
+    held has been read for the last time, optionally after reordering the
+    gates with `depth_first`.  Inputs keep their indices and the outputs
+    take the last ones, in order, as Bristol Fashion requires.  Evaluators
+    that run the gates in order compute the same outputs with a `wire_count`
+    of the peak number of live wires (plus the outputs).
+    """
+    table = gate_table(circ)
+    gate = depth_first(table) if reorder else table.gate
+
+    # Outputs are live past the last gate, and get their own indices instead.
+    outputs = {w: k for (k, w) in enumerate(table.wire_out_index)}
+    last = last_reads(gate, outputs)
+
+    register = {w: w for w in range(table.wire_in_count)}
+    free = [w for w in reversed(range(table.wire_in_count)) if w not in last]
+    count = table.wire_in_count
+
+    renumbered = []
+    for (k, (o, a, b, c)) in enumerate(gate):
+        (ra, rb) = (register[a], register[b] if b is not None else None)
+        for w in (a, b):
+            if w is not None and last.get(w) == k and w in register:
+                free.append(register.pop(w))
+        if c in outputs:
+            register[c] = -1 - outputs[c]  # Placed after all other registers below
+        else:
+            if len(free) == 0:
+                free.append(count)
+                count += 1
+            register[c] = free.pop()
+        renumbered.append((o, ra, rb, register[c]))
+        if c not in last:  # Never read, so the register is free again
+            free.append(register.pop(c))
+
+    index = lambda r : r if r is None or r >= 0 else count - 1 - r
+    renumbered = [(o, index(a), index(b), index(c)) for (o, a, b, c) in renumbered]
+    return listed_circuit(renumbered, count + len(outputs), table.value_in_length, table.value_out_length)
@@ -1,11 +1,23 @@
 import sys
+import argparse
+from secrets import randbits
 
 from tqdm import tqdm
 from bitlist import bitlist
 from circuit import *
 from circuitry import *
-from bfcl import circuit as bristol_fashion
-from mpc_in_the_head import mpc_emulate
+from mpc_in_the_head import mpc_emulate, garbled_size, preprocessing_count
+from LowMC import linear_layer_counts
+import bristol
+import direct
+import bitslice
+import codegen
+import minimize
+import optimize
+import registers
+import verify
+import challenge
+import randomness
 
 def bit_optimize(o, v, *args):
     """Collapses gates when they have constants as inputs."""
@@ -35,12 +47,114 @@ def bit_optimize(o, v, *args):
 
 bit.hook_operation(bit_optimize)
 
-in_path = sys.argv[1]
+# Chained challenge blocks make proof circuits as deep as they are long,
+# and `circuit` walks the gates reaching the outputs recursively.
+sys.setrecursionlimit(1 << 20)
+
+parser = argparse.ArgumentParser(description="Synthesize a NIZK proof circuit.")
+parser.add_argument("in_path", help="Bristol Fashion circuit to synthesize a proof circuit for")
+parser.add_argument("--compress", choices=sorted(bristol.codecs), default=None,
+                    help="compress the emitted circuit file while it is written")
+parser.add_argument("--direct", action="store_true",
+                    help="write gates to disk during emulation instead of building the circuit first")
+parser.add_argument("--check", type=int, default=0, metavar="N",
+                    help="check the outputs of the proof circuit against the input circuit and verify its proofs on N random inputs")
+parser.add_argument("--challenge", choices=challenge.modes, default='chain',
+                    help="how the challenge is derived from the views (see challenge.stage)")
+parser.add_argument("--repetitions", type=int, default=2, metavar="K",
+                    help="number of MPC repetitions emulated in the proof (at most 128)")
+parser.add_argument("--preprocessing", type=int, default=None, metavar="M",
+                    help="number of repetitions whose Beaver triples are opened and checked instead of their views "
+                         "(fewer than K, half of K by default)")
+parser.add_argument("--seed", type=int, default=None,
+                    help="seed the randomness of the proof circuit, for reproducible runs")
+parser.add_argument("--seeded", action="store_true",
+                    help="derive each party's randomness from a seed and open seeds instead of views")
+parser.add_argument("--minimize", action="store_true",
+                    help="rewrite the input circuit with fewer ANDs before emulating it")
+parser.add_argument("--optimize", action="store_true",
+                    help="remove NOT pairs, duplicate gates and dead gates from the proof circuit")
+parser.add_argument("--renumber", nargs="?", const="keep", choices=["keep", "depth-first"], default=None,
+                    help="reuse the indices of dead wires in the proof circuit, keeping or reordering its gates")
+args = parser.parse_args()
+if (args.optimize or args.renumber) and args.direct and args.compress:
+    parser.error("--optimize and --renumber read back the direct output, which cannot be compressed")
+try:
+    preprocessing_count(args.repetitions, args.preprocessing)
+except ValueError as e:
+    parser.error(str(e))
+
+in_path = args.in_path
 in_name = in_path.split("/")[-1]
-out_name = "nizk_"+in_path.split("/")[-1]
+out_name = "nizk_"+in_path.split("/")[-1] + ("." + args.compress if args.compress else "")
 out_path = './' + out_name #''.join(in_path.split("/")[:-1])+"/"+out_name # sys.argv[2]
-plain_circuit = bristol_fashion(open(in_path).read())
-proof_circuit = synthesize(mpc_emulate(plain_circuit, n=3)).circuit
+input_circuit = bristol.lazy_circuit(in_path)
+plain_circuit = input_circuit
+if args.minimize:
+    plain_circuit = minimize.minimize(input_circuit)
+    print(" * ANDs in the input circuit: ", garbled_size(plain_circuit), "after minimization instead of", garbled_size(input_circuit))
+def check(proof_circuit, n):
+    """Evaluate both circuits on `n` random inputs at once, compare outputs and verify the proofs."""
+    words = [randbits(n) for _ in range(plain_circuit.wire_in_count)]
+    expected = codegen.compile_circuit(in_path)(words, (1 << n) - 1)
+    outputs = bitslice.gate_table(proof_circuit).evaluate_packed(words, n)
+    print(" * checked outputs on " + str(n) + " random inputs: ",
+          "ok" if outputs[0:len(expected)] == expected else "MISMATCH")
+    valid = verify.check(
+        plain_circuit, options['n'], outputs, n, args.challenge, args.repetitions, args.seeded, args.preprocessing
+    )
+    rejected = n - valid.bit_count()
+    print(" * verified proofs on " + str(n) + " random inputs: ",
+          "ok" if rejected == 0 else str(rejected) + " REJECTED")
+
+def optimized(proof_circuit):
+    """Optimize the proof circuit, reporting the gates left of each operation."""
+    circ = optimize.optimize(proof_circuit)
+    counts = optimize.op_counts(circ)
+    print("Optimized to " + str(circ.gate_count) + " gates:")
+    print(' * operation counts: ', {o.name(): counts.get(tuple(o), 0) for o in op_list})
+    return circ
+
+def renumbered(proof_circuit):
+    """Reuse the indices of dead wires, reporting the wires left."""
+    wire_count = bristol.layout(proof_circuit)[1]
+    circ = registers.renumber(proof_circuit, reorder=args.renumber == "depth-first")
+    print(" * wires after renumbering: ", circ.wire_count, "instead of", wire_count)
+    return circ
+
+def report_linear_layer():
+    (naive, shared) = linear_layer_counts()
+    print(" * LowMC linear layer XORs per challenge block: ", shared, "shared instead of", naive)
+
+# Parameters of the emulated MPC
+options = {
+    'n': 3, 'challenge_mode': args.challenge, 'repetitions': args.repetitions,
+    'pool': randomness.pool(seed=args.seed), 'seeded': args.seeded, 'preprocessing': args.preprocessing
+}
+
+op_list = [op.not_, op.and_, op.xor_, op.or_, op.nand_, op.nor_, op.nif_, op.id_, op.xnor_, op.nimp_]
+
+if args.direct:
+    # Emit each gate as the emulation creates it; nothing is kept in memory
+    # but the wires the emulation itself still refers to.
+    sink = direct.sink(out_path, plain_circuit.wire_in_count, args.compress)
+    gate_count = sink.close(mpc_emulate(plain_circuit, backend=sink, **options)(sink.inputs()))
+    print("Synthesized `" + out_name + "` directly with " + str(gate_count) + " gates:")
+    print(' * operation counts: ', {o.name(): sink.counts.get(o, 0) for o in op_list})
+    report_linear_layer()
+    if args.optimize or args.renumber:
+        proof_circuit = bristol.lazy_circuit(out_path)
+        if args.optimize:
+            proof_circuit = optimized(proof_circuit)
+        if args.renumber:
+            proof_circuit = renumbered(proof_circuit)
+        with bristol.open_output(out_path) as circuit_file:
+            bristol.emit(proof_circuit, circuit_file)
+    if args.check and not args.compress:
+        check(bristol.lazy_circuit(out_path), args.check)
+    sys.exit(0)
+
+proof_circuit = synthesize(mpc_emulate(plain_circuit, **options)).circuit
 
 in_int8s = [3, 4, 3, 4] + \
            [5, 4, 3, 4]
@@ -49,15 +163,22 @@ in_bits = [b for i8 in in_int8s for b in bits.from_byte(i8, lambda b: b)]
 print("Synthesized `" + out_name + "` with " + str(len(proof_circuit.gate)) + " gates:")
 print(' * operation counts: ', {
     o.name(): proof_circuit.count(lambda g: g.operation == o)
-    for o in [op.not_, op.and_, op.xor_, op.or_, op.nand_, op.nif_, op.id_, op.xnor_, op.nimp_]
+    for o in op_list
 })
+report_linear_layer()
 
 to_bin = lambda xs : ''.join(map(str, list(xs)))
 print(" * circuit to evaluate on input: ", to_bin(in_bits))
 print(" * evaluated circuit got output: ", to_bin(reversed(bitlist(proof_circuit.evaluate(in_bits)).bits)))
+if args.optimize:
+    proof_circuit = optimized(proof_circuit)
+if args.renumber:
+    proof_circuit = renumbered(proof_circuit)
+if args.check:
+    check(proof_circuit, args.check)
 
-with open(out_path, 'w') as circuit_file:
-    # Build and emit the Bristol Fashion circuit file.
-    circuit_file.write(bristol_fashion(proof_circuit).emit(
-        progress=lambda gs: tqdm(gs, desc=' * emitting circuit file')
-    ))
+with bristol.open_output(out_path, args.compress) as circuit_file:
+    # Stream the Bristol Fashion circuit file to disk.
+    bristol.emit(proof_circuit, circuit_file,
+        progress=lambda gs: tqdm(gs, desc=' * emitting circuit file', total=bristol.layout(proof_circuit)[0])
+    )
@@ -0,0 +1,50 @@
+import random
+
+import bristol
+import challenge
+import randomness
+import packed
+import verify
+from mpc_in_the_head import garbled_size, randomness_sources, commitment_keys
+from packed import native_encrypt
+
+circuit_file = 'sample_circuits/and4.txt'
+
+
+def test_every_flipped_proof_bit_is_rejected():
+    for path in (circuit_file, 'sample_circuits/logic-bristol-test.txt'):
+        circ = bristol.lazy_circuit(path)
+        rng = random.Random(1)
+        for seeded in (False, True):
+            for mode in challenge.modes:
+                options = {'challenge_mode': mode, 'repetitions': 4, 'seeded': seeded}
+                inputs = [rng.getrandbits(1) for _ in range(circ.wire_in_count)]
+                proof = packed.prove(path, inputs, pool=randomness.pool(seed=rng.getrandbits(32)), **options)
+                flipped = [proof[0:k] + [1 - proof[k]] + proof[k+1:] for k in range(len(proof))]
+                assert verify.verify(path, [proof], **options) == [True]
+                assert not any(verify.verify(path, flipped, **options))
+
+
+def test_an_empty_batch_has_no_results():
+    assert verify.verify(circuit_file, []) == []
+
+
+def test_commitments_of_a_party_stay_keyed_together():
+    # The hidden party's commitments to its views and to its triples are both
+    # opened, so no combination of the two may lose the keys.
+    circ = bristol.lazy_circuit(circuit_file)
+    rng = random.Random(0)
+    (views, triples) = ([rng.getrandbits(1) for _ in range(k)] for k in (1000, 300))
+    encrypt = native_encrypt()
+    for seeded in (False, True):
+        for mode in challenge.modes:
+            combined = set()
+            for seed in range(4):
+                pool = randomness.pool(seed=seed)
+                sources = randomness_sources(circ, garbled_size(circ), 3, 1, pool, seeded)
+                (keys, triple_keys) = commitment_keys(sources, 3, pool, seeded, int)
+                (view_stage, triple_stage) = (challenge.stage(encrypt, int, mode) for _ in range(2))
+                view_stage.absorb(keys[0][3] + views)
+                triple_stage.absorb(triple_keys[0][3] + triples)
+                combined.add(tuple(x ^ y for (x, y) in zip(view_stage.derive(), triple_stage.derive())))
+            assert len(combined) == 4
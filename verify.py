@@ -0,0 +1,275 @@
+# Batch verification of proofs from `mpc_emulate`, bit-sliced across proofs:
+# bit `j` of every word belongs to proof `j`, so one pass over the circuit
+# (and one LowMC evaluation per block) checks all of the proofs at once
+
+import hashlib
+
+from circuit import op
+from bristol import gates, layout, last_reads, lazy_circuit
+from LowMC import init_encrypt
+from mpc_in_the_head import (
+    mux, and_forms, garbled_size, opened_size, preprocessing_count, preprocessing_indices,
+    derive_preprocessing_challenge, derive_challenge
+)
+import challenge
+import randomness
+
+
+def by_party(opened, hidden, e, n):  # -> list
+    """
+    Words `[None, w_1, ..., w_n]` of each party from the words of the opened
+    parties (party `1+j+e` in place `j`) and that of the hidden party.
+    """
+    return [None] + [
+        mux(e, opened[q-1] if q < n else hidden, opened[q-2] if q > 1 else hidden)
+        for q in range(1, n+1)
+    ]
+
+
+def transpose(values, width):  # -> list
+    """One word per bit position of the `width` bit ints in `values`, bit `j` from `values[j]`."""
+    rows = [format(v, '0' + str(width) + 'b') for v in values]
+    return [int(''.join(column)[::-1], 2) for column in zip(*rows)][::-1]
+
+
+def lanes_of(words, lanes):  # -> list
+    """The ints whose bits are held by `words`, one per lane (the inverse of `transpose`)."""
+    return [sum(((w >> j) & 1) << k for (k, w) in enumerate(words)) for j in range(lanes)]
+
+
+def tape_words(seeds, length):  # -> list
+    """Bit-sliced random tapes expanded from the seeds of each lane, as `randomness.tapes` does."""
+    size = randomness.tapes.seed_size // 8
+    tapes = [
+        int.from_bytes(hashlib.shake_128(seed.to_bytes(size, 'little')).digest((length + 7) // 8), 'little')
+        for seed in seeds
+    ]
+    return transpose(tapes, 8 * ((length + 7) // 8))[0:length]
+
+
+def rerun(circ, ands, last_read, n, opened, output, e, stage, mask, seeded):  # -> (list, list, list, int)
+    """
+    Re-run the opened parties of one repetition of `circ` (with `ands` ANDs
+    and the `bristol.last_reads` of its gates) on the bit-sliced `opened`
+    proof bits for challenge bits `e`.  Returns the commitments of every
+    party to its views and to its triples and the output shares of every
+    party (those of the hidden party from the proof and the outputs), and
+    the lanes whose opened views are consistent.
+    """
+    (ins, outs) = (circ.wire_in_count, circ.wire_out_count)
+    parties = range(n-1)
+    first = [mask & ~e if j == 0 else 0 for j in parties]  # Lanes where the opened party is party 1
+    last = [e if j == n-2 else 0 for j in parties]  # Lanes where it is party n
+    valid = mask
+    equal = lambda x, y : mask & ~(x ^ y)
+
+    if seeded:
+        keys = [opened[j*128:(j+1)*128] for j in parties]
+        seeds = [lanes_of(keys[j], mask.bit_length()) for j in parties]
+        tapes = [tape_words(seeds[j], ins + 3*ands + 128) for j in parties]
+        triple_keys = [tapes[j][ins+3*ands:] for j in parties]
+        offset = (n-1) * 128
+        inputs_1 = opened[offset:offset+ins]
+        for x in inputs_1:
+            valid &= equal(x & e, 0)
+        wires = [[mux(first[j], tapes[j][w], inputs_1[w]) for w in range(ins)] for j in parties]
+        corrections = opened[offset+ins:offset+ins+3*ands]
+    else:
+        size = 2*n+5
+        offset = (n-1) * ands * size
+        wires = [opened[offset+j*ins:offset+(j+1)*ins] for j in parties]
+        offset += (n-1) * ins
+        keys = [opened[offset+j*128:offset+(j+1)*128] for j in parties]
+        offset += (n-1) * 128
+        triple_keys = [opened[offset+j*128:offset+(j+1)*128] for j in parties]
+
+    RAM = [[None]*circ.wire_count for _ in parties]
+    for j in parties:
+        RAM[j][0:ins] = wires[j]
+    commitments = [stage() for _ in parties]
+    triple_commitments = [stage() for _ in parties]
+    for j in parties:
+        commitments[j].absorb(keys[j])
+        triple_commitments[j].absorb(triple_keys[j])
+
+    k = 0
+    for (g, (operation, in1, in2, out)) in enumerate(gates(circ)):
+        zs = [None for _ in parties]
+        for j in parties:
+            if operation == op.xor_:
+                zs[j] = RAM[j][in1] ^ RAM[j][in2]
+            if operation == op.xnor_:
+                zs[j] = RAM[j][in1] ^ RAM[j][in2] ^ first[j]
+            if operation == op.not_:
+                zs[j] = RAM[j][in1] ^ first[j]  # Only party 1 flips its share
+            if operation == op.id_:
+                zs[j] = RAM[j][in1]
+
+        if operation in and_forms:
+            (fx, fy, fz) = and_forms[operation]
+            xs = [RAM[j][in1] ^ (first[j] if fx else 0) for j in parties]
+            ys = [RAM[j][in2] ^ (first[j] if fy else 0) for j in parties]
+            if seeded:
+                t = ins + 3*k
+                (d_hidden, e_hidden, c_n) = corrections[3*k:3*k+3]
+                valid &= equal(c_n & ~e, 0)
+                abc = [(tapes[j][t], tapes[j][t+1], mux(last[j], tapes[j][t+2], c_n)) for j in parties]
+                ds = by_party([xs[j] ^ abc[j][0] for j in parties], d_hidden, e, n)
+                es = by_party([ys[j] ^ abc[j][1] for j in parties], e_hidden, e, n)
+                views = [list(abc[j]) + [xs[j], ys[j]] + ds[1:] + es[1:] for j in parties]
+            else:
+                views = [opened[(j*ands+k)*size:(j*ands+k+1)*size] for j in parties]
+                for j in parties:
+                    (a, b, c, x, y) = views[j][0:5]
+                    (ds, es) = ([None] + views[j][5:5+n], [None] + views[j][5+n:size])
+                    valid &= equal(x, xs[j]) & equal(y, ys[j])
+                    valid &= equal(mux(e, ds[1+j], ds[2+j]), x ^ a) & equal(mux(e, es[1+j], es[2+j]), y ^ b)
+                    for (u, v) in zip(views[j][5:], views[0][5:]):
+                        valid &= equal(u, v)
+                (ds, es) = ([None] + views[0][5:5+n], [None] + views[0][5+n:size])
+
+            (d, e_) = (0, 0)
+            for i in range(1, n+1):
+                (d, e_) = (d ^ ds[i], e_ ^ es[i])
+            for j in parties:
+                (a, b, c) = views[j][0:3]
+                z = c ^ (xs[j] & e_) ^ (ys[j] & d) ^ (first[j] & d & e_)
+                zs[j] = z ^ (first[j] if fz else 0)
+                commitments[j].absorb(views[j])
+                triple_commitments[j].absorb(views[j][0:3])
+            k += 1
+
+        for j in parties:
+            for w in (in1, in2):
+                if last_read.get(w) == g:
+                    RAM[j][w] = None
+            RAM[j][out] = zs[j]
+
+    hidden = opened[len(opened)-256:]
+    (commitment, triples) = [
+        [None] + [list(bits) for bits in zip(*[
+            by_party([digest[b] for digest in digests], h, e, n)[1:] for (b, h) in enumerate(hidden[t:t+128])
+        ])]
+        for (t, digests) in [(0, [c.derive() for c in commitments]), (128, [c.derive() for c in triple_commitments])]
+    ]
+
+    output_shares = []
+    for (w, y) in zip(range(circ.wire_count - outs, circ.wire_count), output):
+        shares = [RAM[j][w] for j in parties]
+        hidden_share = y
+        for s in shares:
+            hidden_share ^= s
+        output_shares.append(by_party(shares, hidden_share, e, n))
+    output_shares = [None] + [[shares[i] for shares in output_shares] for i in range(1, n+1)]
+    return (commitment, triples, output_shares, valid)
+
+
+def rerun_preprocessing(circ, ands, n, opened, stage, mask, seeded):  # -> (list, int)
+    """
+    Recompute the commitment of every party to its triples from the
+    bit-sliced `opened` preprocessing of one repetition (see
+    `open_preprocessing`, padded with 0s).  Returns the commitments and the
+    lanes where every triple has `c = a & b` and the padding is all 0s.
+    """
+    keys = [None] + [opened[(i-1)*128:i*128] for i in range(1, n+1)]
+    offset = n * 128
+    if seeded:
+        t = circ.wire_in_count
+        tapes = [None] + [tape_words(lanes_of(keys[i], mask.bit_length()), t + 3*ands + 128) for i in range(1, n+1)]
+        keys = [None] + [tapes[i][t+3*ands:] for i in range(1, n+1)]  # Those of the commitments to the triples
+        triple = lambda i, k : tapes[i][t+3*k:t+3*k+2] + [tapes[i][t+3*k+2] if i < n else opened[offset+k]]
+    else:
+        triple = lambda i, k : opened[offset+((i-1)*ands+k)*3:offset+((i-1)*ands+k+1)*3]
+
+    commitments = [None] + [stage() for _ in range(n)]
+    for i in range(1, n+1):
+        commitments[i].absorb(keys[i])
+    valid = mask
+    for x in opened[offset + (ands if seeded else 3*n*ands):]:
+        valid &= mask & ~x
+    for k in range(ands):
+        (a, b, c) = (0, 0, 0)
+        for i in range(1, n+1):
+            abc = triple(i, k)
+            commitments[i].absorb(abc)
+            (a, b, c) = (a ^ abc[0], b ^ abc[1], c ^ abc[2])
+        valid &= mask & ~(c ^ (a & b))
+    return ([None] + [s.derive() for s in commitments[1:]], valid)
+
+
+def preprocessed_lanes(opened, lanes, repetitions, count):  # -> list
+    """
+    For each repetition, the lanes where its preprocessing is opened, given
+    the bit-sliced first challenges `opened` (see `preprocessing_indices`).
+    """
+    preprocessed = [0]*repetitions
+    for (j, challenge_bits) in enumerate(lanes_of(opened, lanes)):
+        for r in preprocessing_indices([(challenge_bits >> k) & 1 for k in range(128)], repetitions, count):
+            preprocessed[r] |= 1 << j
+    return preprocessed
+
+
+def check(
+    circ, n, words, lanes, challenge_mode='chain', repetitions=1, seeded=False, preprocessing=None, ands=None
+):  # -> int
+    """
+    Lanes of the bit-sliced `words` (one per bit of the output of the proof
+    circuit for `circ`) that hold a valid proof.  `ands` is the number of
+    ANDs of `circ`, if already counted.
+    """
+    count = preprocessing_count(repetitions, preprocessing)
+    ands = garbled_size(circ) if ands is None else ands
+    last_read = last_reads(gates(circ), layout(circ)[4])
+    mask = (1 << lanes) - 1
+    constant = lambda b : mask if b else 0
+    encrypt = init_encrypt(constant, lambda bs : [constant(b) for b in bs])
+    stage = lambda : challenge.stage(encrypt, constant, challenge_mode)
+
+    outs = circ.wire_out_count
+    size = opened_size(circ, ands, n, seeded)
+    output = words[0:outs]
+    end = outs + size*repetitions
+    (opened, chosen_indices) = (words[end:end+128], words[end+128:end+256])
+    preprocessed = preprocessed_lanes(opened, lanes, repetitions, count)
+
+    valid = mask
+    (commitments, triple_commitments, output_shares) = ([], [], [])
+    for r in range(repetitions):
+        bits = words[outs+size*r:outs+size*(r+1)]
+        p = preprocessed[r]
+        (commitment, triples, shares, consistent) = rerun(circ, ands, last_read, n, bits, output, chosen_indices[r], stage, mask, seeded)
+        (opened_triples, sound) = rerun_preprocessing(circ, ands, n, bits, stage, mask, seeded)
+        commitments.append(commitment)
+        triple_commitments.append([None] + [
+            [mux(p, x, y) for (x, y) in zip(triples[i], opened_triples[i])] for i in range(1, n+1)
+        ])
+        output_shares.append(shares)
+        valid &= (consistent | p) & (sound | ~p)
+
+    for (x, y) in zip(derive_preprocessing_challenge(triple_commitments, stage()), opened):
+        valid &= mask & ~(x ^ y)
+    for (x, y) in zip(derive_challenge(opened, preprocessed, commitments, output_shares, stage()), chosen_indices):
+        valid &= mask & ~(x ^ y)
+    return valid
+
+
+def verify(circuit_file, proofs, n=3, challenge_mode='chain', repetitions=1, seeded=False, preprocessing=None):  # -> list
+    """
+    Check the output and proof bits of the proof circuit for the Bristol
+    Fashion circuit in `circuit_file` (as given by `packed.prove` or by
+    evaluating the proof circuit), one list of bits per proof, for the
+    options the proof circuit was built with.  Returns whether each proof
+    is valid.
+    """
+    circ = lazy_circuit(circuit_file)
+    ands = garbled_size(circ)
+    width = circ.wire_out_count + opened_size(circ, ands, n, seeded) * repetitions + 256
+    for proof in proofs:
+        if len(proof) != width:
+            raise ValueError("proof circuit gives " + str(width) + " bits, not " + str(len(proof)))
+    if len(proofs) == 0:
+        return []
+    digits = bytes.maketrans(b'\0\1', b'01')
+    words = transpose([int(bytes(proof).translate(digits)[::-1], 2) for proof in proofs], width)
+    valid = check(circ, n, words, len(proofs), challenge_mode, repetitions, seeded, preprocessing, ands)
+    return [bool((valid >> j) & 1) for j in range(len(proofs))]